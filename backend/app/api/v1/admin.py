@@ -1,30 +1,77 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select, and_, or_
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, and_, or_, tuple_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from ...services.auth import get_current_user, get_current_admin      # ← fixed
-from ...db.models import SessionLocal, UnansweredQuery, Message, ChatSession, User
-from datetime import datetime
+from ...db.models import get_db, matches_search, UnansweredQuery, Message, ChatSession, User
+from datetime import date
 
 
 router = APIRouter()
 
+# Upper bound on rows returned per analytics page
+MAX_ANALYTICS_PAGE_SIZE = 1000
+
+
+def _years_before(day: date, years: int) -> date:
+    """Same calendar day `years` earlier, clamping Feb 29 to Feb 28."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+async def _keyset_after(db: AsyncSession, model, after_id: int):
+    """(created_at, id) of the cursor row, read back from the table itself.
+
+    Comparing against the stored timestamp rather than one round-tripped through
+    the client keeps the comparison exact (SQLite stores server-default
+    timestamps without microseconds). An id that matches no row is a 400, rather
+    than a silently empty page.
+    """
+    if await db.scalar(select(model.id).where(model.id == after_id)) is None:
+        raise HTTPException(status_code=400, detail="Unknown after_id cursor")
+    cursor_created_at = select(model.created_at).where(model.id == after_id).scalar_subquery()
+    return tuple_(cursor_created_at, after_id)
+
+
+def _paginate(base, query, model, offset: int, limit: int):
+    """Order `query` newest first and cut out one page.
+
+    With an offset this is a deferred join: the OFFSET is applied to an id-only
+    version of the filtered query, and `base` (the same joins, unfiltered) is
+    joined back against just those ids to load the full rows.
+    """
+    order = (model.created_at.desc(), model.id.desc())
+    if not offset:
+        return query.order_by(*order).limit(limit)
+    page_ids = query.with_only_columns(model.id).order_by(*order).offset(offset).limit(limit).subquery()
+    return base.join(page_ids, model.id == page_ids.c.id).order_by(*order)
+
+
+def _analytics_page(results: list, last) -> dict:
+    """Wrap a page of analytics rows with the cursor for the following page."""
+    next_cursor = {"after_id": last.id} if last is not None else None
+    return {"results": results, "next_cursor": next_cursor}
+
+
 @router.get("/unanswered")
-async def list_unanswered(limit: int = 20, user=Depends(get_current_user)):
-    async with SessionLocal() as db:
-        rows = (await db.execute(
-            select(UnansweredQuery)
-            .order_by(UnansweredQuery.created_at.desc())
-            .limit(limit)
-        )).scalars().all()
-        return [
-            {
-                "text": r.text,
-                "location": r.location,
-                "score": r.score,
-                "reason": r.reason,
-                "created_at": r.created_at,
-            }
-            for r in rows
+async def list_unanswered(limit: int = 20, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    rows = (await db.execute(
+        select(UnansweredQuery)
+        .order_by(UnansweredQuery.created_at.desc())
+        .limit(limit)
+    )).scalars().all()
+    return [
+        {
+            "text": r.text,
+            "location": r.location,
+            "score": r.score,
+            "reason": r.reason,
+            "created_at": r.created_at,
+        }
+        for r in rows
 ]
 
 @router.get("/analytics")
@@ -43,125 +90,155 @@ async def analytics(
     user_id: int = None,
     session_id: int = None,
     category: str = None,
-    user=Depends(get_current_admin)
+    q: str = None,
+    after_id: int = None,
+    offset: int = None,
+    limit: int = 100,
+    user=Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db),
 ):
-    async with SessionLocal() as db:
-        filters = []
-        user_filters = []
-        if ethnic_group:
-            user_filters.append(User.ethnic_group == ethnic_group)
-        if gender:
-            user_filters.append(User.gender == gender)
-        if country:
-            user_filters.append(User.country == country)
-        if long_term_conditions:
-            user_filters.append(User.long_term_conditions.like(f"%{long_term_conditions}%"))
-        if medications:
-            user_filters.append(User.medications.like(f"%{medications}%"))
-        if min_age or max_age:
-            from datetime import datetime
-            today = datetime.today()
-            if min_age:
-                max_birth = today.replace(year=today.year - min_age)
-                user_filters.append(User.date_of_birth <= max_birth.strftime("%Y-%m-%d"))
-            if max_age:
-                min_birth = today.replace(year=today.year - max_age)
-                user_filters.append(User.date_of_birth >= min_birth.strftime("%Y-%m-%d"))
-        if user_id:
-            user_filters.append(User.id == user_id)
-        if session_id:
-            filters.append(ChatSession.id == session_id)
-        if answered:
-            # Answered: filter on Message (assistant role)
-            query = select(Message, ChatSession, User).join(ChatSession, Message.session_id == ChatSession.id).join(User, ChatSession.user_id == User.id).where(Message.role == "assistant")
-            if rag_score_min is not None:
-                filters.append(Message.confidence_score >= rag_score_min)
-            if rag_score_max is not None:
-                filters.append(Message.confidence_score <= rag_score_max)
-            if user_filters:
-                query = query.where(and_(*user_filters))
-            if filters:
-                query = query.where(and_(*filters))
-            
-            # Apply category filter after getting the data
-            rows = (await db.execute(query)).all()
-            results = []
-            for msg, session, user in rows:
-                # Use the stored user_question if available, otherwise fall back to lookup
-                if msg.user_question:
-                    question_text = msg.user_question
-                    question_category = None  # We'll get category from the user message if needed
-                else:
-                    # Get the corresponding user question for this assistant response (fallback)
-                    user_question_query = select(Message).where(
-                        Message.session_id == session.id,
-                        Message.role == "user",
-                        Message.created_at < msg.created_at
-                    ).order_by(Message.created_at.desc()).limit(1)
-                    
-                    user_question_result = await db.execute(user_question_query)
-                    user_question = user_question_result.scalar_one_or_none()
-                    question_text = user_question.content if user_question else "Unknown question"
-                    question_category = user_question.category if user_question else None
-                
-                # Apply category filter
-                if category and question_category and question_category != category:
-                    continue
-                
-                results.append({
-                    "question": question_text,
-                    "answer": msg.content,
-                    "session_id": session.id,
-                    "user_id": user.id,
-                    "ethnic_group": user.ethnic_group,
-                    "gender": user.gender,
-                    "date_of_birth": user.date_of_birth,
-                    "country": user.country,
-                    "long_term_conditions": user.long_term_conditions,
-                    "medications": user.medications,
-                    "created_at": msg.created_at,
-                    "rag_score": msg.confidence_score,
-                    "reason": None,
-                    "sources": msg.sources,
-                    "category": question_category,
-                })
-            return results
-        else:
-            # Unanswered: filter on UnansweredQuery
-            from sqlalchemy.orm import outerjoin
-            query = select(UnansweredQuery, ChatSession, User)\
-                .outerjoin(ChatSession, UnansweredQuery.session_id == ChatSession.id)\
-                .outerjoin(User, ChatSession.user_id == User.id)
-            if reason:
-                filters.append(UnansweredQuery.reason == reason)
-            if rag_score_min is not None:
-                filters.append(UnansweredQuery.score >= rag_score_min)
-            if rag_score_max is not None:
-                filters.append(UnansweredQuery.score <= rag_score_max)
-            if user_filters:
-                query = query.where(and_(*user_filters))
-            if filters:
-                query = query.where(and_(*filters))
-            rows = (await db.execute(query)).all()
-            results = []
-            for uq, session, user in rows:
-                # Apply category filter for unanswered queries
-                if category and uq.category != category:
-                    continue
-                results.append({
-                    "question": uq.text,
-                    "session_id": session.id if session else None,
-                    "user_id": user.id if user else None,
-                    "ethnic_group": user.ethnic_group if user else None,
-                    "gender": user.gender if user else None,
-                    "date_of_birth": user.date_of_birth if user else None,
-                    "country": user.country if user else None,
-                    "long_term_conditions": user.long_term_conditions if user else None,
-                    "medications": user.medications if user else None,
-                    "created_at": uq.created_at,
-                    "rag_score": uq.score,
-                    "reason": uq.reason,
-                    "sources": uq.sources,
-                    "category": uq.category,
-                })
-            return results
+    # Keyset pagination: rows come newest first by (created_at, id), and the id of
+    # the last row on a page is passed back as after_id to fetch the next one.
+    # offset is still accepted for page-number style UIs.
+    limit = max(1, min(limit, MAX_ANALYTICS_PAGE_SIZE))
+    filters = []
+    user_filters = []
+    if ethnic_group:
+        user_filters.append(User.ethnic_group == ethnic_group)
+    if gender:
+        user_filters.append(User.gender == gender)
+    if country:
+        user_filters.append(User.country == country)
+    if long_term_conditions:
+        user_filters.append(User.long_term_conditions.ilike(f"%{long_term_conditions}%"))
+    if medications:
+        user_filters.append(User.medications.ilike(f"%{medications}%"))
+    if min_age or max_age:
+        # date_of_birth is stored as an ISO string, so plain string comparison
+        # orders correctly and stays index-friendly
+        today = date.today()
+        if min_age:
+            max_birth = _years_before(today, min_age)
+            user_filters.append(User.date_of_birth <= max_birth.isoformat())
+        if max_age:
+            # Still max_age until the day before the (max_age + 1)th birthday
+            min_birth = _years_before(today, max_age + 1)
+            user_filters.append(User.date_of_birth > min_birth.isoformat())
+    if user_id:
+        user_filters.append(User.id == user_id)
+    if session_id:
+        filters.append(ChatSession.id == session_id)
+    if answered:
+        # Answered: filter on Message (assistant role)
+        # Pair each assistant message with the user message that preceded it in the
+        # same session, so the question/category come back in the same query.
+        # Ids, not timestamps: both rows of a turn are written together and share
+        # created_at, so a timestamp comparison would pick the previous turn.
+        user_msg = aliased(Message)
+        prev_msg = aliased(Message)
+        prev_user_msg_id = (
+            select(prev_msg.id)
+            .where(
+                prev_msg.session_id == Message.session_id,
+                prev_msg.role == "user",
+                prev_msg.id < Message.id,
+            )
+            .order_by(prev_msg.id.desc())
+            .limit(1)
+            .correlate(Message)
+            .scalar_subquery()
+        )
+        # The turn's category is stored on the assistant row; older rows only have it on the question
+        turn_category = func.coalesce(Message.category, user_msg.category)
+        base = select(Message, ChatSession, User, user_msg.content, turn_category)\
+            .join(ChatSession, Message.session_id == ChatSession.id)\
+            .join(User, ChatSession.user_id == User.id)\
+            .outerjoin(user_msg, user_msg.id == prev_user_msg_id)\
+            .where(Message.role == "assistant")
+        query = base
+        if rag_score_min is not None:
+            filters.append(Message.confidence_score >= rag_score_min)
+        if rag_score_max is not None:
+            filters.append(Message.confidence_score <= rag_score_max)
+        if category:
+            # Rows whose category is unknown are kept, as they always were
+            filters.append(or_(turn_category == category, turn_category.is_(None)))
+        if q:
+            filters.append(matches_search(q, Message.content, Message.user_question))
+        if after_id is not None:
+            filters.append(tuple_(Message.created_at, Message.id) < await _keyset_after(db, Message, after_id))
+        if user_filters:
+            query = query.where(and_(*user_filters))
+        if filters:
+            query = query.where(and_(*filters))
+        query = _paginate(base, query, Message, offset, limit)
+        
+        rows = (await db.execute(query)).all()
+        results = []
+        for msg, session, user, user_question_text, question_category in rows:
+            # Prefer the stored user_question, fall back to the preceding user message
+            question_text = msg.user_question or user_question_text or "Unknown question"
+            results.append({
+                "question": question_text,
+                "answer": msg.content,
+                "session_id": session.id,
+                "user_id": user.id,
+                "ethnic_group": user.ethnic_group,
+                "gender": user.gender,
+                "date_of_birth": user.date_of_birth,
+                "country": user.country,
+                "long_term_conditions": user.long_term_conditions,
+                "medications": user.medications,
+                "created_at": msg.created_at,
+                "rag_score": msg.confidence_score,
+                "reason": None,
+                "sources": msg.sources,
+                "category": question_category,
+            })
+        last = rows[-1][0] if len(rows) == limit else None
+        return _analytics_page(results, last)
+    else:
+        # Unanswered: filter on UnansweredQuery
+        from sqlalchemy.orm import outerjoin
+        base = select(UnansweredQuery, ChatSession, User)\
+            .outerjoin(ChatSession, UnansweredQuery.session_id == ChatSession.id)\
+            .outerjoin(User, ChatSession.user_id == User.id)
+        query = base
+        if reason:
+            filters.append(UnansweredQuery.reason == reason)
+        if rag_score_min is not None:
+            filters.append(UnansweredQuery.score >= rag_score_min)
+        if rag_score_max is not None:
+            filters.append(UnansweredQuery.score <= rag_score_max)
+        if category:
+            filters.append(UnansweredQuery.category == category)
+        if q:
+            filters.append(matches_search(q, UnansweredQuery.text))
+        if after_id is not None:
+            filters.append(tuple_(UnansweredQuery.created_at, UnansweredQuery.id) < await _keyset_after(db, UnansweredQuery, after_id))
+        if user_filters:
+            query = query.where(and_(*user_filters))
+        if filters:
+            query = query.where(and_(*filters))
+        query = _paginate(base, query, UnansweredQuery, offset, limit)
+        rows = (await db.execute(query)).all()
+        results = []
+        for uq, session, user in rows:
+            results.append({
+                "question": uq.text,
+                "session_id": session.id if session else None,
+                "user_id": user.id if user else None,
+                "ethnic_group": user.ethnic_group if user else None,
+                "gender": user.gender if user else None,
+                "date_of_birth": user.date_of_birth if user else None,
+                "country": user.country if user else None,
+                "long_term_conditions": user.long_term_conditions if user else None,
+                "medications": user.medications if user else None,
+                "created_at": uq.created_at,
+                "rag_score": uq.score,
+                "reason": uq.reason,
+                "sources": uq.sources,
+                "category": uq.category,
+            })
+        last = rows[-1][0] if len(rows) == limit else None
+        return _analytics_page(results, last)
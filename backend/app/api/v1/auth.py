@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, EmailStr
 from typing import Optional
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from ...services.auth import authenticate, _hash_pw, get_user_by_email, get_current_user
-from ...db.models import SessionLocal, User
+from ...services.auth import authenticate, hash_password, get_current_user, invalidate_user
+from ...db.models import get_db, User
 
 router = APIRouter()
 
@@ -19,8 +21,8 @@ class LoginOut(BaseModel):
 
 
 @router.post("/login", response_model=LoginOut)
-async def login(body: LoginIn):
-    token = await authenticate(body.email, body.password)
+async def login(body: LoginIn, db: AsyncSession = Depends(get_db)):
+    token = await authenticate(db, body.email, body.password)
     return {"access_token": token}
 
 
@@ -38,30 +40,33 @@ class RegisterIn(LoginIn):
 
 
 @router.post("/register")
-async def register(body: RegisterIn):
-    existing = await get_user_by_email(body.email)
-    if existing:
-        return {"detail": "User exists"}
-
-    async with SessionLocal() as db:
-        user_kwargs = dict(email=body.email, hashed_pw=_hash_pw(body.password))
-        if body.consent_to_data_storage:
-            user_kwargs.update(
-                full_name=body.full_name,
-                date_of_birth=body.date_of_birth,
-                gender=body.gender,
-                sex=body.sex,
-                country=body.country,
-                address=body.address,
-                ethnic_group=body.ethnic_group,
-                long_term_conditions=body.long_term_conditions,
-                medications=body.medications,
-                consent_to_data_storage=True
-            )
-        else:
-            user_kwargs["consent_to_data_storage"] = False
-        db.add(User(**user_kwargs))
+async def register(body: RegisterIn, db: AsyncSession = Depends(get_db)):
+    # bcrypt is deliberately slow; hash off the event loop
+    hashed_pw = await hash_password(body.password)
+    user_kwargs = dict(email=body.email, hashed_pw=hashed_pw)
+    if body.consent_to_data_storage:
+        user_kwargs.update(
+            full_name=body.full_name,
+            date_of_birth=body.date_of_birth,
+            gender=body.gender,
+            sex=body.sex,
+            country=body.country,
+            address=body.address,
+            ethnic_group=body.ethnic_group,
+            long_term_conditions=body.long_term_conditions,
+            medications=body.medications,
+            consent_to_data_storage=True
+        )
+    else:
+        user_kwargs["consent_to_data_storage"] = False
+    db.add(User(**user_kwargs))
+    # No SELECT beforehand: the unique index on email rejects duplicates,
+    # including two concurrent registrations for the same address
+    try:
         await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return {"detail": "User exists"}
     return {"detail": "ok"}
 
 
@@ -98,30 +103,36 @@ class UserUpdateIn(BaseModel):
     password: Optional[str] = None
 
 @router.put("/me")
-async def update_me(body: UserUpdateIn, user=Depends(get_current_user)):
-    async with SessionLocal() as db:
-        db_user = await db.get(User, user.id)
-        if db_user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-        update_fields = body.dict(exclude_unset=True)
-        if "password" in update_fields:
-            db_user.hashed_pw = _hash_pw(update_fields.pop("password"))
-        for k, v in update_fields.items():
-            setattr(db_user, k, v)
+async def update_me(body: UserUpdateIn, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_user = await db.get(User, user.id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    update_fields = body.dict(exclude_unset=True)
+    if "password" in update_fields:
+        db_user.hashed_pw = await hash_password(update_fields.pop("password"))
+    for k, v in update_fields.items():
+        setattr(db_user, k, v)
+    # Skip the round trip when nothing actually changed; after a commit the
+    # in-memory values are current (expire_on_commit=False), so no refresh
+    if db.is_modified(db_user):
         await db.commit()
-        await db.refresh(db_user)
-        return {
-            "email": db_user.email,
-            "is_admin": db_user.is_admin,
-            "full_name": db_user.full_name,
-            "date_of_birth": db_user.date_of_birth,
-            "gender": db_user.gender,
-            "sex": db_user.sex,
-            "country": db_user.country,
-            "address": db_user.address,
-            "ethnic_group": db_user.ethnic_group,
-            "long_term_conditions": db_user.long_term_conditions,
-            "medications": db_user.medications,
-            "consent_to_data_storage": db_user.consent_to_data_storage,
-            "id": db_user.id,
-        }
+        invalidate_user(db_user.id)
+    return _user_dict(db_user)
+
+
+def _user_dict(db_user: User) -> dict:
+    return {
+        "email": db_user.email,
+        "is_admin": db_user.is_admin,
+        "full_name": db_user.full_name,
+        "date_of_birth": db_user.date_of_birth,
+        "gender": db_user.gender,
+        "sex": db_user.sex,
+        "country": db_user.country,
+        "address": db_user.address,
+        "ethnic_group": db_user.ethnic_group,
+        "long_term_conditions": db_user.long_term_conditions,
+        "medications": db_user.medications,
+        "consent_to_data_storage": db_user.consent_to_data_storage,
+        "id": db_user.id,
+    }
@@ -1,4 +1,5 @@
 from ...db.models import (
+    get_db,
     SessionLocal,
     ChatSession,
     Message,
@@ -6,13 +7,25 @@ from ...db.models import (
     User,  # Add User import for type hints
 )
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime
+from functools import lru_cache
+import logging
 import re
+import orjson
+import tiktoken
 from ...services.auth import get_current_user
-from ...services.rag import answer
+from ...services.rag import answer, AnswerStream
 from ...services.categorization import categorize_question, get_available_categories
-from sqlalchemy import select, desc
+from sqlalchemy import select, insert, delete, desc, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Markdown-style "(https://...)" links in a generated answer
+_URL_RE = re.compile(r'\((https?://[^\s)]+)\)')
 
 router = APIRouter()
 
@@ -25,7 +38,7 @@ class MessageOut(BaseModel):
     id: int
     role: str
     content: str
-    created_at: str
+    created_at: datetime
     category: Optional[str] = None
     # sources: Optional[List[str]] = None
     # response_metadata: Optional[dict] = None  # Changed from metadata to response_metadata
@@ -37,28 +50,98 @@ class ChatOut(BaseModel):
     messages: List[MessageOut] = []
     metadata: dict = {}  # Include metadata for debugging/analytics
 
-def build_user_context(user: 'User') -> str:
-    if not getattr(user, 'consent_to_data_storage', False):
-        return ""
-    info = []
-    if user.full_name:
-        info.append(f"Full Name: {user.full_name}")
-    if user.date_of_birth:
-        info.append(f"Date of Birth: {user.date_of_birth}")
-    if user.gender:
-        info.append(f"Gender: {user.gender}")
-    if user.sex:
-        info.append(f"Sex: {user.sex}")
-    if user.country:
-        info.append(f"Country: {user.country}")
-    if user.address:
-        info.append(f"Address: {user.address}")
-    if user.ethnic_group:
-        info.append(f"Ethnic Group: {user.ethnic_group}")
-    if user.long_term_conditions:
-        info.append(f"Long-term Medical Conditions: {user.long_term_conditions}")
-    if user.medications:
-        info.append(f"Medications: {user.medications}")
+# Only the columns MessageOut needs, for read paths that don't need ORM objects
+_MESSAGE_OUT_COLUMNS = (
+    Message.id,
+    Message.role,
+    Message.content,
+    Message.created_at,
+    Message.category,
+)
+
+# Every inserted row carries the same keys so a turn's messages share one INSERT
+_MESSAGE_INSERT_DEFAULTS = {
+    "category": None,
+    "confidence_score": None,
+    "sources": None,
+    "user_question": None,
+}
+
+async def _insert_messages(db: AsyncSession, *messages: dict) -> list:
+    """Insert messages with a single INSERT ... RETURNING; rows come back in order."""
+    result = await db.execute(
+        insert(Message).returning(*_MESSAGE_OUT_COLUMNS, sort_by_parameter_order=True),
+        [{**_MESSAGE_INSERT_DEFAULTS, **message} for message in messages],
+        # Keep the None defaults in the statement instead of splitting it by key set
+        execution_options={"render_nulls": True},
+    )
+    return result.all()
+
+# Prior turns sent with each question are capped by size, not message count
+HISTORY_TOKEN_BUDGET = 1500
+
+# Loaded once at startup; tiktoken downloads the BPE file on first use, which
+# must not happen on the event loop or fail a chat turn
+_encoding: Optional[tiktoken.Encoding] = None
+
+def load_encoding() -> None:
+    """Load the tokenizer for history budgeting; run in a worker thread from the app lifespan."""
+    global _encoding
+    try:
+        _encoding = tiktoken.encoding_for_model("gpt-4o")
+    except Exception as e:
+        logger.warning("Tokenizer unavailable, estimating history tokens from length: %s", e)
+
+def _token_count(content: str) -> int:
+    if _encoding is None:
+        return len(content) // 4  # Roughly four characters per token for English text
+    return len(_encoding.encode(content))
+
+def _history_within_budget(messages, budget: int = HISTORY_TOKEN_BUDGET) -> List[dict]:
+    """Most recent messages (oldest first) whose combined content fits in `budget` tokens."""
+    history = []
+    for msg in reversed(messages):
+        budget -= _token_count(msg.content)
+        if budget < 0:
+            break
+        history.append({"role": msg.role, "content": msg.content})
+    history.reverse()
+    return history
+
+def _message_out(msg) -> MessageOut:
+    """Build a MessageOut from a Message or a row of _MESSAGE_OUT_COLUMNS."""
+    return MessageOut(
+        id=msg.id,
+        role=msg.role,
+        content=msg.content,
+        created_at=msg.created_at,
+        category=msg.category,
+        # sources=msg.sources,
+        # response_metadata=msg.response_metadata
+    )
+
+# (User attribute, label) pairs included in the user context, in prompt order
+_USER_CONTEXT_FIELDS = (
+    ("full_name", "Full Name"),
+    ("date_of_birth", "Date of Birth"),
+    ("gender", "Gender"),
+    ("sex", "Sex"),
+    ("country", "Country"),
+    ("address", "Address"),
+    ("ethnic_group", "Ethnic Group"),
+    ("long_term_conditions", "Long-term Medical Conditions"),
+    ("medications", "Medications"),
+)
+
+@lru_cache(maxsize=1024)
+def _user_context_from_values(values: tuple) -> str:
+    # Keyed on the profile values themselves, so an updated profile simply
+    # produces a new entry and nothing needs invalidating.
+    info = [
+        f"{label}: {value}"
+        for (_, label), value in zip(_USER_CONTEXT_FIELDS, values)
+        if value
+    ]
     if not info:
         return ""
     return (
@@ -66,336 +149,331 @@ def build_user_context(user: 'User') -> str:
         + " | ".join(info)
     )
 
-@router.post("/chat", response_model=ChatOut)
-async def chat(body: ChatIn, user=Depends(get_current_user)):
-    async with SessionLocal() as db:
-        # ---------- Get or create chat session ---------------------------
-        session = None
-        print(f"[DEBUG] Request session_id: {body.session_id}")
-        
-        if body.session_id:
-            # Try to get existing session
-            result = await db.execute(
-                select(ChatSession).where(
-                    ChatSession.id == body.session_id,
-                    ChatSession.user_id == user.id
-                )
-            )
-            session = result.scalar_one_or_none()
-            print(f"[DEBUG] Found existing session: {session.id if session else 'None'}")
-        
-        if not session:
-            # Create new session
-            print(f"[DEBUG] Creating new session")
-            session = ChatSession(
-                user_id=user.id,
-                location=body.location
+def build_user_context(user: 'User') -> str:
+    if not getattr(user, 'consent_to_data_storage', False):
+        return ""
+    return _user_context_from_values(
+        tuple(getattr(user, field) for field, _ in _USER_CONTEXT_FIELDS)
+    )
+
+async def _start_turn(body: ChatIn, user, db: AsyncSession):
+    """
+    Load (or create) the chat session and everything answer() needs for this turn.
+    
+    Returns (session_id, history_messages, conversation_history, user_context, category).
+    """
+    # ---------- Get or create chat session ---------------------------
+    # History is loaded BEFORE adding the current message to build proper context,
+    # and is also reused to build the response message list.
+    session_id = None
+    history_messages = []
+    logger.debug("Request session_id: %s", body.session_id)
+    
+    if body.session_id:
+        # Verify the session belongs to the user and fetch its messages in one query;
+        # an empty session still yields one row with NULL message columns
+        result = await db.execute(
+            select(ChatSession.id.label("session_id"), *_MESSAGE_OUT_COLUMNS)
+            .outerjoin(Message, Message.session_id == ChatSession.id)
+            .where(
+                ChatSession.id == body.session_id,
+                ChatSession.user_id == user.id
             )
-            db.add(session)
-            await db.commit()
-            await db.refresh(session)
-            print(f"[DEBUG] Created new session with ID: {session.id}")
-        
-        # ---------- Get conversation history for context ------------------
-        # Get history BEFORE adding current message to build proper context
-        history_result = await db.execute(
-            select(Message)
-            .where(Message.session_id == session.id)
-            .order_by(Message.created_at)
-            .limit(20)  # Limit to last 20 messages for context
+            .order_by(Message.created_at, Message.id)
         )
-        history_messages = history_result.scalars().all()
-        
-        print(f"[DEBUG] Found {len(history_messages)} existing messages in session {session.id}")
-        
-        # Build conversation history for GPT-4o (existing messages only)
-        conversation_history = []
-        for msg in history_messages[-10:]:  # Use last 10 for context
-            role = "assistant" if msg.role == "assistant" else msg.role
-            conversation_history.append({
-                "role": role, 
-                "content": msg.content
-            })
-        # Build user context string (do not prepend to conversation_history)
-        user_context = build_user_context(user)
-        
-        print(f"[DEBUG] Built conversation history with {len(conversation_history)} messages")
-        if conversation_history:
-            print(f"[DEBUG] Conversation history details:")
-            for i, msg in enumerate(conversation_history):
-                print(f"  {i+1}. {msg['role']}: {msg['content'][:100]}...")
-        else:
-            print(f"[DEBUG] No conversation history found - history_messages length was {len(history_messages)}")
-            
-        # Additional debugging - print raw database messages
-        print(f"[DEBUG] Raw database messages:")
-        for i, msg in enumerate(history_messages):
-            print(f"  DB {i+1}. ID:{msg.id} Role:{msg.role} Content:{msg.content[:50]}...")
-        
-        # ---------- Categorize ALL questions BEFORE saving user message ---------------
-        category = None
-        try:
-            category = categorize_question(body.message)
-            print(f"[DEBUG] Question categorized as: {category}")
-            print(f"[DEBUG] Category type: {type(category)}")
-            print(f"[DEBUG] Category length: {len(category) if category else 0}")
-        except Exception as e:
-            print(f"[DEBUG] Categorization error: {e}")
-            category = None
-        
-        # ---------- Save user message AFTER getting history ---------------
-        print(f"[DEBUG] Creating user message with category: '{category}'")
-        user_message = Message(
-            session_id=session.id,
-            role="user",
-            content=body.message,
-            category=category  # Now properly categorized for all questions
+        rows = result.all()
+        if rows:
+            session_id = rows[0].session_id
+            history_messages = [row for row in rows if row.id is not None]
+        logger.debug("Found existing session: %s", session_id)
+    
+    if session_id is None:
+        # Create new session
+        session = ChatSession(
+            user_id=user.id,
+            location=body.location
         )
-        db.add(user_message)
-        # Don't commit yet - we'll commit both messages together
-        
-        # ---------- Generate response with hybrid system -----------------
-        try:
-            # Build contextual query for RAG (if medical)
-            contextual_query = body.message  # Default to just the current message
-            
-            if conversation_history:
-                print(f"[DEBUG] Building contextual query with {len(conversation_history)} previous messages")
-                
-                # Create context-aware query for RAG classification and retrieval
-                context_messages = []
-                for msg in conversation_history[-5:]:  # Last 5 for context
-                    context_messages.append(f"{msg['role']}: {msg['content']}")
-                
-                # Add current message to context
-                context_messages.append(f"user: {body.message}")
-                
-                contextual_query = f"Previous conversation:\n" + "\n".join(context_messages[:-1]) + f"\n\nCurrent question: {body.message}"
-                print(f"[DEBUG] Contextual query: {contextual_query[:300]}...")
-            else:
-                print(f"[DEBUG] No conversation history, using direct query: {body.message}")
-            
-            print(f"[DEBUG] Calling answer() with:")
-            print(f"  - Query: {contextual_query[:100]}...")
-            print(f"  - Original query: {body.message}")
-            print(f"  - Conversation history items: {len(conversation_history)}")
-            
-            # Call the hybrid RAG + GPT-4o system
-            response, sources, metadata = answer(
-                query=contextual_query,
-                conversation_history=conversation_history,
-                original_query=body.message,
-                user_context=user_context
-            )
-            
-            # Determine which sources to save
-            if metadata.get("used_rag"):
-                sources_to_save = sources if sources else None
-            else:
-                sources_to_save = re.findall(r'\((https?://[^\s)]+)\)', response)  # fallback, could extract from response if needed
+        db.add(session)
+        await db.commit()
+        session_id = session.id
+        logger.debug("Created new session with ID: %s", session_id)
+    
+    # Build conversation history for GPT-4o (existing messages only)
+    conversation_history = _history_within_budget(history_messages)
+    # Build user context string (do not prepend to conversation_history)
+    user_context = build_user_context(user)
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Session %s: %d stored messages, %d in conversation history",
+            session_id, len(history_messages), len(conversation_history),
+        )
+        for i, msg in enumerate(conversation_history):
+            logger.debug("  %d. %s: %.100s", i + 1, msg["role"], msg["content"])
+    
+    # ---------- Categorize ALL questions BEFORE saving user message ---------------
+    category = None
+    try:
+        category = await categorize_question(body.message)
+        logger.debug("Question categorized as: %r", category)
+    except Exception as e:
+        logger.warning("Categorization error: %s", e)
+        category = None
+    
+    return session_id, history_messages, conversation_history, user_context, category
 
-            # ---------- Save unanswered if needed ----------------------------
-            if metadata.get("is_medical", False) and not metadata.get("used_rag", False):
-                print(f"[DEBUG] Saving unanswered query with category: '{category}'")
-                unanswered_query = UnansweredQuery(
-                    text=body.message,
-                    location=body.location,
-                    reason=f"medical_question_no_rag",
-                    score=metadata.get('rag_score', 0.0),
-                    category=category,  # Already categorized above
-                    session_id=session.id,
-                    sources=sources_to_save,
-                )
-                db.add(unanswered_query)
-                await db.commit()
-                await db.refresh(unanswered_query)
-                print(f"[DEBUG] Unanswered query saved with ID: {unanswered_query.id}, category: '{unanswered_query.category}'")
-            
-        except Exception as e:
-            # Log the error
-            db.add(
-                UnansweredQuery(
-                    text=body.message,
-                    location=body.location,
-                    reason=f"system_error: {str(e)}",
-                    category=category,  # Will be None if categorization failed
-                    session_id=session.id,
-                    sources=sources if sources else None,
-                )
-            )
-            
-            # Save error message
-            error_message = Message(
-                session_id=session.id,
-                role="assistant",
-                content="I'm having trouble responding right now. Please try again in a moment."
-            )
-            db.add(error_message)
-            await db.commit()
-            
-            # Get all messages for response
-            all_messages_result = await db.execute(
-                select(Message)
-                .where(Message.session_id == session.id)
-                .order_by(Message.created_at)
-            )
-            all_messages = all_messages_result.scalars().all()
-            
-            return {
-                "response": "I'm having trouble responding right now. Please try again in a moment.",
-                "sources": [],
-                "session_id": session.id,
-                "messages": [
-                    MessageOut(
-                        id=msg.id,
-                        role=msg.role,
-                        content=msg.content,
-                        created_at=msg.created_at.isoformat(),
-                        category=msg.category
-                    ) for msg in all_messages
-                ],
-                "metadata": {"error": True}
-            }
+def _answer_kwargs(body: ChatIn, conversation_history: List[dict], user_context: str) -> dict:
+    """Arguments for answer() / AnswerStream for this turn."""
+    # Build contextual query for RAG (if medical)
+    contextual_query = body.message  # Default to just the current message
+    
+    if conversation_history:
+        # Create context-aware query for RAG classification and retrieval
+        context_messages = []
+        for msg in conversation_history[-5:]:  # Last 5 for context
+            context_messages.append(f"{msg['role']}: {msg['content']}")
         
-        # ---------- Success - save both messages together ---------------------
-        print(f"[DEBUG] Creating assistant message with category: '{category}'")
-        assistant_message = Message(
-            session_id=session.id,
-            role="assistant",
-            content=response,
-            confidence_score=metadata.get("rag_score") if metadata else None,
+        contextual_query = f"Previous conversation:\n" + "\n".join(context_messages) + f"\n\nCurrent question: {body.message}"
+    
+    logger.debug("Calling answer() with query: %.300s", contextual_query)
+    return dict(
+        query=contextual_query,
+        conversation_history=conversation_history,
+        original_query=body.message,
+        user_context=user_context
+    )
+
+def _record_answer(db: AsyncSession, body: ChatIn, session_id: int, category, response: str, sources, metadata: dict):
+    """Sources to store with the answer; also queues an UnansweredQuery if it needs one."""
+    # Determine which sources to save
+    if metadata.get("used_rag"):
+        sources_to_save = sources if sources else None
+    else:
+        sources_to_save = _URL_RE.findall(response)  # fallback, could extract from response if needed
+
+    # ---------- Save unanswered if needed ----------------------------
+    if metadata.get("is_medical", False) and not metadata.get("used_rag", False):
+        unanswered_query = UnansweredQuery(
+            text=body.message,
+            location=body.location,
+            reason=f"medical_question_no_rag",
+            score=metadata.get('rag_score', 0.0),
+            category=category,  # Already categorized above
+            session_id=session_id,
             sources=sources_to_save,
-            user_question=body.message,  # Store the original user question
-            category=category,  # Include the category for the assistant response
-            # sources=sources,  # Store sources with the message
-            # response_metadata=metadata  # Store metadata with the message (renamed from metadata)
         )
-        db.add(assistant_message)
-        
-        # Commit both messages together
-        await db.commit()
-        await db.refresh(user_message)
-        await db.refresh(assistant_message)
-        print(f"[DEBUG] User message saved with ID: {user_message.id}, category: '{user_message.category}'")
-        print(f"[DEBUG] Assistant message saved with ID: {assistant_message.id}, category: '{assistant_message.category}'")
-        
-        # Get all messages for response
-        all_messages_result = await db.execute(
-            select(Message)
-            .where(Message.session_id == session.id)
-            .order_by(Message.created_at)
+        # Committed together with both messages in _save_turn
+        db.add(unanswered_query)
+    return sources_to_save
+
+def _user_message(body: ChatIn, session_id: int, category) -> dict:
+    return dict(
+        session_id=session_id,
+        role="user",
+        content=body.message,
+        category=category  # Now properly categorized for all questions
+    )
+
+async def _save_turn(
+    db: AsyncSession, body: ChatIn, session_id: int, category, history_messages,
+    response: str, sources, metadata: dict, sources_to_save,
+) -> dict:
+    """Save the question and answer together and build the ChatOut payload."""
+    assistant_message = dict(
+        session_id=session_id,
+        role="assistant",
+        content=response,
+        confidence_score=metadata.get("rag_score") if metadata else None,
+        sources=sources_to_save,
+        user_question=body.message,  # Store the original user question
+        category=category,  # Include the category for the assistant response
+        # sources=sources,  # Store sources with the message
+        # response_metadata=metadata  # Store metadata with the message (renamed from metadata)
+    )
+    
+    # Commit both messages (and any unanswered query) together; IDs and server-side
+    # created_at come back from the INSERT, so no refresh or re-select is needed
+    saved = await _insert_messages(db, _user_message(body, session_id, category), assistant_message)
+    await db.commit()
+    logger.debug(
+        "Saved messages %s (user) and %s (assistant) with category %r",
+        saved[0].id, saved[1].id, category,
+    )
+    
+    return {
+        "response": response,
+        "sources": sources,
+        "session_id": session_id,
+        "messages": [
+            _message_out(msg)
+            for msg in [*history_messages, *saved]
+        ],
+        "metadata": metadata
+    }
+
+async def _save_failed_turn(
+    db: AsyncSession, body: ChatIn, session_id: int, category, history_messages, error: Exception,
+) -> dict:
+    """Record the failure, save the question with an apology and build the ChatOut payload."""
+    # Log the error
+    db.add(
+        UnansweredQuery(
+            text=body.message,
+            location=body.location,
+            reason=f"system_error: {str(error)}",
+            category=category,  # Will be None if categorization failed
+            session_id=session_id,
+            sources=None,
         )
-        all_messages = all_messages_result.scalars().all()
-        
-        return {
-            "response": response,
-            "sources": sources,
-            "session_id": session.id,
-            "messages": [
-                MessageOut(
-                    id=msg.id,
-                    role=msg.role,
-                    content=msg.content,
-                    created_at=msg.created_at.isoformat(),
-                    category=msg.category,
-                    # sources=msg.sources,
-                    # response_metadata=msg.response_metadata
-                ) for msg in all_messages
-            ],
-            "metadata": metadata
-        }
+    )
+    
+    # Save error message
+    error_message = dict(
+        session_id=session_id,
+        role="assistant",
+        content="I'm having trouble responding right now. Please try again in a moment."
+    )
+    saved = await _insert_messages(db, _user_message(body, session_id, category), error_message)
+    await db.commit()
+    
+    return {
+        "response": "I'm having trouble responding right now. Please try again in a moment.",
+        "sources": [],
+        "session_id": session_id,
+        "messages": [
+            _message_out(msg)
+            for msg in [*history_messages, *saved]
+        ],
+        "metadata": {"error": True}
+    }
+
+@router.post("/chat", response_model=ChatOut)
+async def chat(body: ChatIn, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    session_id, history_messages, conversation_history, user_context, category = await _start_turn(body, user, db)
+    
+    # ---------- Generate response with hybrid system -----------------
+    try:
+        # Call the hybrid RAG + GPT-4o system; its blocking retrieval and OpenAI
+        # calls run in worker threads, keeping the event loop free
+        response, sources, metadata = await answer(**_answer_kwargs(body, conversation_history, user_context))
+        sources_to_save = _record_answer(db, body, session_id, category, response, sources, metadata)
+    except Exception as e:
+        return await _save_failed_turn(db, body, session_id, category, history_messages, e)
+    
+    # ---------- Success - save both messages together ---------------------
+    return await _save_turn(
+        db, body, session_id, category, history_messages, response, sources, metadata, sources_to_save
+    )
+
+@router.post("/chat/stream")
+async def chat_stream(body: ChatIn, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Same as POST /chat, but the answer is streamed as newline-delimited JSON:
+    {"type": "delta", "content": ...} events while GPT-4o writes, then a single
+    {"type": "done", ...} event carrying the ChatOut payload. Its "response" has
+    sources formatted in and replaces the streamed text.
+    """
+    session_id, history_messages, conversation_history, user_context, category = await _start_turn(body, user, db)
+    
+    async def events():
+        stream = AnswerStream(**_answer_kwargs(body, conversation_history, user_context))
+        # The request's session is torn down before the body is iterated, so the
+        # turn is saved through its own; no connection is checked out until the insert
+        async with SessionLocal() as turn_db:
+            try:
+                async for chunk in stream:
+                    yield orjson.dumps({"type": "delta", "content": chunk}) + b"\n"
+                response, sources, metadata = stream.result
+                sources_to_save = _record_answer(turn_db, body, session_id, category, response, sources, metadata)
+            except Exception as e:
+                payload = await _save_failed_turn(turn_db, body, session_id, category, history_messages, e)
+            else:
+                payload = await _save_turn(
+                    turn_db, body, session_id, category, history_messages, response, sources, metadata, sources_to_save
+                )
+        yield orjson.dumps({"type": "done", **ChatOut(**payload).model_dump()}) + b"\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
 @router.get("/chat/sessions", response_model=List[dict])
-async def get_chat_sessions(user=Depends(get_current_user)):
+async def get_chat_sessions(user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Get all chat sessions for the current user"""
-    async with SessionLocal() as db:
-        result = await db.execute(
-            select(ChatSession)
-            .where(ChatSession.user_id == user.id)
-            .order_by(desc(ChatSession.created_at))
+    # Rank each session's user messages so the first one can be joined in directly
+    first_msg = (
+        select(
+            Message.session_id,
+            Message.content,
+            func.row_number().over(
+                partition_by=Message.session_id,
+                order_by=Message.created_at,
+            ).label("rn"),
         )
-        sessions = result.scalars().all()
-        
-        session_list = []
-        for session in sessions:
-            # Get the first message for preview
-            first_msg_result = await db.execute(
-                select(Message)
-                .where(Message.session_id == session.id, Message.role == "user")
-                .order_by(Message.created_at)
-                .limit(1)
-            )
-            first_message = first_msg_result.scalar_one_or_none()
-            
-            session_list.append({
-                "id": session.id,
-                "created_at": session.created_at.isoformat(),
-                "location": session.location,
-                "preview": first_message.content[:50] + "..." if first_message else "New conversation"
-            })
-        
-        return session_list
+        .where(
+            Message.role == "user",
+            Message.session_id.in_(
+                select(ChatSession.id).where(ChatSession.user_id == user.id)
+            ),
+        )
+        .subquery()
+    )
+    result = await db.execute(
+        select(ChatSession.id, ChatSession.created_at, ChatSession.location, first_msg.c.content)
+        .outerjoin(
+            first_msg,
+            and_(first_msg.c.session_id == ChatSession.id, first_msg.c.rn == 1),
+        )
+        .where(ChatSession.user_id == user.id)
+        .order_by(desc(ChatSession.created_at))
+    )
+    
+    return [
+        {
+            "id": row.id,
+            "created_at": row.created_at,
+            "location": row.location,
+            "preview": row.content[:50] + "..." if row.content is not None else "New conversation"
+        }
+        for row in result.all()
+    ]
 
 @router.get("/chat/session/{session_id}", response_model=List[MessageOut])
-async def get_session_messages(session_id: int, user=Depends(get_current_user)):
+async def get_session_messages(session_id: int, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Get all messages for a specific session"""
-    async with SessionLocal() as db:
-        # Verify session belongs to user
-        session_result = await db.execute(
-            select(ChatSession).where(
-                ChatSession.id == session_id,
-                ChatSession.user_id == user.id
-            )
+    # Verify session belongs to user and fetch its messages in one query;
+    # an empty session still yields one row with NULL message columns
+    result = await db.execute(
+        select(*_MESSAGE_OUT_COLUMNS)
+        .select_from(ChatSession)
+        .outerjoin(Message, Message.session_id == ChatSession.id)
+        .where(
+            ChatSession.id == session_id,
+            ChatSession.user_id == user.id
         )
-        session = session_result.scalar_one_or_none()
-        
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Get messages
-        messages_result = await db.execute(
-            select(Message)
-            .where(Message.session_id == session_id)
-            .order_by(Message.created_at)
-        )
-        messages = messages_result.scalars().all()
-        
-        return [
-            MessageOut(
-                id=msg.id,
-                role=msg.role,
-                content=msg.content,
-                created_at=msg.created_at.isoformat(),
-                category=msg.category,
-                # sources=msg.sources,
-                # response_metadata=msg.response_metadata
-            ) for msg in messages
-        ]
+        .order_by(Message.created_at, Message.id)
+    )
+    rows = result.all()
+    
+    if not rows:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    return [_message_out(row) for row in rows if row.id is not None]
 
 @router.delete("/chat/session/{session_id}")
-async def delete_chat_session(session_id: int, user=Depends(get_current_user)):
+async def delete_chat_session(session_id: int, user=Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Delete a chat session and all its messages for the current user"""
-    async with SessionLocal() as db:
-        # Verify session belongs to user
-        session_result = await db.execute(
-            select(ChatSession).where(
-                ChatSession.id == session_id,
-                ChatSession.user_id == user.id
-            )
-        )
-        session = session_result.scalar_one_or_none()
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        # Delete all messages for this session
-        await db.execute(
-            Message.__table__.delete().where(Message.session_id == session_id)
-        )
-        # Delete the session itself
-        await db.execute(
-            ChatSession.__table__.delete().where(ChatSession.id == session_id)
+    # One DELETE scoped to the owner; the messages go with it via ON DELETE CASCADE
+    result = await db.execute(
+        delete(ChatSession)
+        .where(
+            ChatSession.id == session_id,
+            ChatSession.user_id == user.id
         )
-        await db.commit()
-        return {"success": True, "session_id": session_id}
+        .returning(ChatSession.id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await db.commit()
+    return {"success": True, "session_id": session_id}
 
 @router.get("/chat/categories")
 async def get_categories():
@@ -1,13 +1,63 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import httpx
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml.html import HtmlElement, HTMLParser
 import re
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, parse_qsl, urlencode, SplitResult
+from collections import OrderedDict
+from functools import lru_cache
 import asyncio
+import time
 
 router = APIRouter(prefix="/api/v1")
 
+# Previews only need the start of a page: the <head> plus the first few <p>/<img>
+MAX_PREVIEW_BYTES = 256 * 1024
+
+# Compiled once; lxml evaluates these in C rather than walking a Python tree
+_HTML_PARSER = HTMLParser()
+_META_XP = etree.XPath("//meta[@content != ''][@property or @name]")
+_TITLE_XP = etree.XPath("string(//title[1])")
+_ICON_XP = etree.XPath("//link[@rel = $rel][@href != '']/@href")
+_IMG_XP = etree.XPath("//img[@src != '']")
+_PARAGRAPH_XP = etree.XPath("//p[string-length(normalize-space()) > 50][1]")
+
+@lru_cache(maxsize=32)
+def _html_parser(encoding: str | None) -> HTMLParser:
+    """Parser decoding the raw bytes with the charset from Content-Type.
+
+    Without one, lxml falls back to the page's <meta charset>. Either way the body
+    is decoded once, by libxml2, instead of first being turned into a str.
+    """
+    if encoding:
+        try:
+            return HTMLParser(encoding=encoding)
+        except LookupError:  # charset libxml2 doesn't know
+            pass
+    return _HTML_PARSER
+
+# Image srcs that are almost never the page's content image
+_IMG_SKIP_RE = re.compile(r'logo|icon|avatar|badge', re.IGNORECASE)
+
+_EMPTY_DOCUMENT = etree.HTML(b"<html></html>", _HTML_PARSER)
+
+# Only these responses are parsed; anything else gets a URL-only preview
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# clean_text patterns
+_WS_RE = re.compile(r'\s+')
+_HOME_PREFIX_RE = re.compile(r'^(Home\s*[-|]\s*)', re.IGNORECASE)
+_SITENAME_SUFFIX_RE = re.compile(r'\s*[-|]\s*[^-|]*$')
+
+# Headers to appear as a regular browser
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
 class LinkPreview(BaseModel):
     title: str
     description: str
@@ -16,78 +66,168 @@ class LinkPreview(BaseModel):
     domain: str
     url: str
 
+# Recently built previews: normalized url -> (expires_at, preview)
+PREVIEW_CACHE_TTL = 3600  # seconds
+PREVIEW_CACHE_SIZE = 1024
+_preview_cache: OrderedDict[str, tuple[float, LinkPreview]] = OrderedDict()
+
+# One pooled client for all previews, so repeat hosts skip the TCP/TLS handshake
+_client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=10.0,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            headers=DEFAULT_HEADERS,
+        )
+    return _client
+
+# Bound on in-flight page fetches across all requests; bursts queue here instead of
+# all competing for sockets and timing out together
+MAX_CONCURRENT_FETCHES = 32
+_fetch_semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+async def close_client() -> None:
+    """Close the shared client; called on application shutdown"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
 @router.get("/link-preview")
 async def get_link_preview(url: str):
     """
     Fetch metadata for a given URL to create rich previews
     """
+    # Validate URL
+    parsed_url = urlparse(url)
+    if not parsed_url.scheme or not parsed_url.netloc:
+        raise HTTPException(status_code=400, detail="Invalid URL")
+    
+    return await _fetch_preview(normalize_preview_url(url))
+
+class LinkPreviewsIn(BaseModel):
+    urls: list[str]
+
+# Per-request limits for the batch endpoint
+MAX_BATCH_URLS = 20
+BATCH_CONCURRENCY = 10
+
+@router.post("/link-previews")
+async def get_link_previews(body: LinkPreviewsIn):
+    """
+    Fetch previews for several URLs at once, concurrently. Results are in input
+    order; a URL that fails gets an error entry instead of a preview.
+    """
+    if len(body.urls) > MAX_BATCH_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_URLS} URLs per request")
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def preview_or_error(url: str):
+        try:
+            async with semaphore:
+                return await get_link_preview(url)
+        except HTTPException as e:
+            return {"url": url, "error": e.detail, "status_code": e.status_code}
+    
+    return await asyncio.gather(*(preview_or_error(url) for url in body.urls))
+
+def normalize_preview_url(url: str) -> str:
+    """Drop the fragment and utm_* tracking parameters so equivalent links share a cache entry"""
+    parts = urlsplit(url)
+    query = parts.query
+    params = parse_qsl(query, keep_blank_values=True)
+    if any(key.lower().startswith('utm_') for key, _ in params):
+        query = urlencode([(key, value) for key, value in params if not key.lower().startswith('utm_')])
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ''))
+
+async def _fetch_preview(url: str) -> LinkPreview:
+    """Preview for a normalized URL, served from the TTL cache when possible"""
+    now = time.monotonic()
+    cached = _preview_cache.get(url)
+    if cached and cached[0] > now:
+        _preview_cache.move_to_end(url)
+        return cached[1]
+    
     try:
-        # Validate URL
-        parsed_url = urlparse(url)
-        if not parsed_url.scheme or not parsed_url.netloc:
-            raise HTTPException(status_code=400, detail="Invalid URL")
-        
-        # Set up headers to appear as a regular browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
-        
-        # Fetch the page with timeout
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, headers=headers, follow_redirects=True)
-            response.raise_for_status()
-            
-        # Parse HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract metadata
-        preview = extract_metadata(soup, url)
-        return preview
-        
+        preview = await _load_preview(url)
     except httpx.TimeoutException:
         raise HTTPException(status_code=408, detail="Request timeout")
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=e.response.status_code, detail=f"HTTP error: {e.response.status_code}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching preview: {str(e)}")
+    
+    # Only successful previews are cached; least recently used entries go first
+    _preview_cache[url] = (now + PREVIEW_CACHE_TTL, preview)
+    _preview_cache.move_to_end(url)
+    while len(_preview_cache) > PREVIEW_CACHE_SIZE:
+        _preview_cache.popitem(last=False)
+    return preview
 
-def extract_metadata(soup: BeautifulSoup, url: str) -> LinkPreview:
+async def _load_preview(url: str) -> LinkPreview:
+    """Download the start of the page and extract its metadata"""
+    # Fetch the page with timeout, reading no more than MAX_PREVIEW_BYTES
+    async with _fetch_semaphore, get_client().stream("GET", url) as response:
+        response.raise_for_status()
+        # PDFs, images, video etc.: answer from the URL alone without downloading the body
+        content_type = response.headers.get('content-type', 'text/html').lower()
+        if not content_type.startswith(HTML_CONTENT_TYPES):
+            return extract_metadata(_EMPTY_DOCUMENT, url)
+        encoding = response.charset_encoding
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) >= MAX_PREVIEW_BYTES:
+                break
+    
+    # Parse HTML with lxml (C parser, no BeautifulSoup tree)
+    root = etree.HTML(bytes(body[:MAX_PREVIEW_BYTES]), _html_parser(encoding))
+    if root is None:  # empty document
+        root = _EMPTY_DOCUMENT
+    
+    # Extract metadata
+    return extract_metadata(root, url)
+
+def extract_metadata(root: HtmlElement, url: str) -> LinkPreview:
     """
-    Extract metadata from HTML soup
+    Extract metadata from the parsed HTML document
     """
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc.replace('www.', '')
+    # Parsed once here and handed to the helpers
+    parts = urlsplit(url)
+    domain = parts.netloc.replace('www.', '')
+    metas = get_meta_contents(root)
     
     # Try to get title from various sources
     title = (
-        get_meta_content(soup, 'og:title') or
-        get_meta_content(soup, 'twitter:title') or
-        (soup.find('title') and soup.find('title').get_text().strip()) or
+        metas.get('og:title') or
+        metas.get('twitter:title') or
+        _TITLE_XP(root).strip() or
         f"Content from {domain}"
     )
     
     # Try to get description
     description = (
-        get_meta_content(soup, 'og:description') or
-        get_meta_content(soup, 'twitter:description') or
-        get_meta_content(soup, 'description') or
-        extract_first_paragraph(soup) or
+        metas.get('og:description') or
+        metas.get('twitter:description') or
+        metas.get('description') or
+        extract_first_paragraph(root) or
         f"Visit {domain} for more information"
     )
     
     # Try to get image
     image = (
-        get_meta_content(soup, 'og:image') or
-        get_meta_content(soup, 'twitter:image') or
-        find_first_image(soup, url)
+        metas.get('og:image') or
+        metas.get('twitter:image') or
+        find_first_image(root, url)
     )
     
     # Try to get favicon
-    favicon = find_favicon(soup, url)
+    favicon = find_favicon(root, parts)
     
     # Clean up title and description
     title = clean_text(title)[:100]
@@ -102,35 +242,29 @@ def extract_metadata(soup: BeautifulSoup, url: str) -> LinkPreview:
         url=url
     )
 
-def get_meta_content(soup: BeautifulSoup, property_name: str) -> str | None:
-    """Get content from meta tag"""
-    # Try property attribute (Open Graph)
-    meta = soup.find('meta', property=property_name)
-    if meta and meta.get('content'):
-        return meta.get('content')
-    
-    # Try name attribute (Twitter, description)
-    meta = soup.find('meta', attrs={'name': property_name})
-    if meta and meta.get('content'):
-        return meta.get('content')
-    
-    return None
+def get_meta_contents(root: HtmlElement) -> dict[str, str]:
+    """Map each meta tag's property/name to its content, in one pass over the page"""
+    metas = {}
+    for meta in _META_XP(root):
+        content = meta.get('content')
+        # property attribute (Open Graph) or name attribute (Twitter, description)
+        for key in (meta.get('property'), meta.get('name')):
+            if key:
+                metas.setdefault(key, content)
+    return metas
 
-def extract_first_paragraph(soup: BeautifulSoup) -> str | None:
+def extract_first_paragraph(root: HtmlElement) -> str | None:
     """Extract first meaningful paragraph"""
-    # Find the first paragraph with substantial text
-    for p in soup.find_all('p'):
-        text = p.get_text().strip()
-        if len(text) > 50:  # Only paragraphs with meaningful content
-            return text
-    return None
+    # Only paragraphs with meaningful content (more than 50 characters)
+    paragraphs = _PARAGRAPH_XP(root)
+    return paragraphs[0].text_content().strip() if paragraphs else None
 
-def find_first_image(soup: BeautifulSoup, base_url: str) -> str | None:
+def find_first_image(root: HtmlElement, base_url: str) -> str | None:
     """Find the first meaningful image"""
     # Look for images that are likely to be content images
-    for img in soup.find_all('img'):
+    for img in _IMG_XP(root):
         src = img.get('src')
-        if src and not any(skip in src.lower() for skip in ['logo', 'icon', 'avatar', 'badge']):
+        if not _IMG_SKIP_RE.search(src):
             # Check if image has reasonable dimensions
             width = img.get('width')
             height = img.get('height')
@@ -145,28 +279,23 @@ def find_first_image(soup: BeautifulSoup, base_url: str) -> str | None:
                 return src  # No dimensions specified, assume it's fine
     return None
 
-def find_favicon(soup: BeautifulSoup, base_url: str) -> str | None:
+def find_favicon(root: HtmlElement, parts: SplitResult) -> str | None:
     """Find favicon"""
-    # Try various favicon selectors
-    selectors = [
-        'link[rel="icon"]',
-        'link[rel="shortcut icon"]',
-        'link[rel="apple-touch-icon"]',
-    ]
-    
-    for selector in selectors:
-        favicon = soup.select_one(selector)
-        if favicon and favicon.get('href'):
-            return favicon.get('href')
+    # Try the various favicon rel values in order of preference
+    for rel in ('icon', 'shortcut icon', 'apple-touch-icon'):
+        hrefs = _ICON_XP(root, rel=rel)
+        if hrefs:
+            return hrefs[0]
     
     # Default favicon location
-    parsed_url = urlparse(base_url)
-    return f"{parsed_url.scheme}://{parsed_url.netloc}/favicon.ico"
+    return f"{parts.scheme}://{parts.netloc}/favicon.ico"
 
 def make_absolute_url(url: str | None, base_url: str) -> str | None:
     """Convert relative URL to absolute"""
     if not url:
         return None
+    if url.startswith(('https://', 'http://')):  # already absolute, skip urljoin's parsing
+        return url
     return urljoin(base_url, url)
 
 def clean_text(text: str) -> str:
@@ -175,10 +304,10 @@ def clean_text(text: str) -> str:
         return ""
     
     # Remove extra whitespace and newlines
-    text = re.sub(r'\s+', ' ', text.strip())
+    text = _WS_RE.sub(' ', text.strip())
     
     # Remove common prefixes/suffixes
-    text = re.sub(r'^(Home\s*[-|]\s*)', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\s*[-|]\s*[^-|]*$', '', text)  # Remove site name suffix
+    text = _HOME_PREFIX_RE.sub('', text)
+    text = _SITENAME_SUFFIX_RE.sub('', text)  # Remove site name suffix
     
     return text
\ No newline at end of file
@@ -5,6 +5,17 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     jwt_secret: str = "CHANGE_ME"
     jwt_alg: str = "HS256"
+    # bcrypt work factor for new hashes; existing hashes keep the cost they were made with
+    bcrypt_rounds: int = 10
+    # Start RAG retrieval while the medical classifier runs; costs extra retrieval
+    # calls on general chat, so turn off to save on embedding usage
+    speculative_rag: bool = True
+    # Collections up to this many chunks are searched exactly with one in-memory
+    # matrix product instead of Chroma's HNSW index (float32, ~6 KB per chunk)
+    dense_index_max_rows: int = 5000
+    # SQLite file that keeps question categories across restarts and test reruns;
+    # unset to keep only the in-process cache
+    category_cache_path: str | None = None
     openai_api_key: str
     database_url: str = "sqlite+aiosqlite:///./dev.db"
 
@@ -18,7 +18,7 @@ async def main():
     CREATE TABLE users (
         id SERIAL PRIMARY KEY,
         email VARCHAR(255) UNIQUE NOT NULL,
-        hashed_pw VARCHAR(255) NOT NULL,
+        hashed_pw BYTEA NOT NULL,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         full_name VARCHAR(255),
         date_of_birth VARCHAR(50),
@@ -44,11 +44,11 @@ async def main():
     -- Create messages table
     CREATE TABLE messages (
         id SERIAL PRIMARY KEY,
-        session_id INTEGER NOT NULL REFERENCES chat_sessions(id),
+        session_id INTEGER NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
         role VARCHAR(10) NOT NULL,
         content TEXT NOT NULL,
         confidence_score FLOAT,
-        sources JSON,
+        sources JSONB,
         category VARCHAR(50),
         user_question TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -63,22 +63,31 @@ async def main():
         score FLOAT,
         category VARCHAR(50),
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        session_id INTEGER REFERENCES chat_sessions(id),
-        sources JSON
+        session_id INTEGER REFERENCES chat_sessions(id) ON DELETE SET NULL,
+        sources JSONB
     );
     
     -- Create indexes
     CREATE INDEX IF NOT EXISTS ix_users_email ON users(email);
+    CREATE INDEX IF NOT EXISTS ix_messages_session_created ON messages(session_id, created_at);
+    CREATE INDEX IF NOT EXISTS ix_messages_session_role_created ON messages(session_id, role, created_at);
+    CREATE INDEX IF NOT EXISTS ix_messages_created_id ON messages(created_at, id);
+    CREATE INDEX IF NOT EXISTS ix_unanswered_queries_created_id ON unanswered_queries(created_at, id);
+    CREATE INDEX IF NOT EXISTS ix_unanswered_category_created ON unanswered_queries(category, created_at);
+    CREATE INDEX IF NOT EXISTS ix_unanswered_session ON unanswered_queries(session_id);
+    CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING gin (to_tsvector('english', (coalesce(content, '') || ' ') || coalesce(user_question, '')));
+    CREATE INDEX IF NOT EXISTS ix_unanswered_queries_search ON unanswered_queries USING gin (to_tsvector('english', coalesce(text, '')));
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS ix_users_long_term_conditions_trgm ON users USING gin (long_term_conditions gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS ix_users_medications_trgm ON users USING gin (medications gin_trgm_ops);
     """
     
     try:
         async with engine.begin() as conn:
-            # Split and execute each statement
-            statements = create_tables_sql.split(';')
-            for statement in statements:
-                statement = statement.strip()
-                if statement:
-                    await conn.execute(text(statement))
+            # Send the whole script in one round trip: asyncpg runs an unparameterized
+            # multi-statement string via the simple query protocol, as one transaction
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.execute(create_tables_sql)
             print("✅ All database tables created successfully!")
             
             # Check what tables exist now
@@ -1,23 +1,58 @@
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-from sqlalchemy.ext.asyncio import AsyncAttrs, create_async_engine, async_sessionmaker
+from typing import Optional, List, Dict, Any, AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, synonym
-from sqlalchemy import String, ForeignKey, JSON, func, Text, Column, Integer, Float, DateTime
+from sqlalchemy import String, ForeignKey, JSON, func, Text, Column, Integer, Float, DateTime, Index, LargeBinary, event, text, or_
+from sqlalchemy.dialects.postgresql import JSONB
+import orjson
 from ..core.config import get_settings
 
 settings = get_settings()
-engine = create_async_engine(settings.database_url, echo=False)
+engine = create_async_engine(
+    settings.database_url,
+    echo=False,
+    # orjson for the JSON columns: several times faster than the stdlib in both directions
+    json_serializer=lambda value: orjson.dumps(value).decode(),
+    json_deserializer=orjson.loads,
+)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        # SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked, per connection
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency yielding one session for the lifetime of a request."""
+    async with SessionLocal() as db:
+        yield db
+
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
+# Binary jsonb on Postgres (parsed once on write, GIN-indexable); plain JSON elsewhere
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Trigram indexes let the admin analytics substring filters (ILIKE '%x%')
+        # use an index on Postgres; they need the pg_trgm extension
+        Index("ix_users_long_term_conditions_trgm", "long_term_conditions",
+              postgresql_using="gin", postgresql_ops={"long_term_conditions": "gin_trgm_ops"}
+              ).ddl_if(dialect="postgresql"),
+        Index("ix_users_medications_trgm", "medications",
+              postgresql_using="gin", postgresql_ops={"medications": "gin_trgm_ops"}
+              ).ddl_if(dialect="postgresql"),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True)
-    hashed_pw: Mapped[str] = mapped_column(String(255))
+    hashed_pw: Mapped[bytes] = mapped_column(LargeBinary)  # raw bcrypt hash; checkpw takes bytes as-is
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     full_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     date_of_birth: Mapped[Optional[str]] = mapped_column(String(10), nullable=True)  # ISO date string
@@ -40,16 +75,25 @@ class ChatSession(Base):
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     
     user: Mapped["User"] = relationship(backref="sessions")
+    # Messages are removed by the database (ON DELETE CASCADE), not loaded and deleted one by one
+    messages: Mapped[List["Message"]] = relationship(order_by="Message.created_at", passive_deletes=True)
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # History/transcript reads filter by session and order by time; some also filter on role
+        Index("ix_messages_session_created", "session_id", "created_at"),
+        Index("ix_messages_session_role_created", "session_id", "role", "created_at"),
+        # Admin analytics pages through messages newest first by (created_at, id)
+        Index("ix_messages_created_id", "created_at", "id"),
+    )
     
     id: Mapped[int] = mapped_column(primary_key=True)
-    session_id: Mapped[int] = mapped_column(ForeignKey("chat_sessions.id"))
+    session_id: Mapped[int] = mapped_column(ForeignKey("chat_sessions.id", ondelete="CASCADE"))
     role: Mapped[str] = mapped_column(String(10))  # "user" / "assistant" / "system"
     content: Mapped[str] = mapped_column(Text)
     confidence_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # RAG score
-    sources: Mapped[Optional[List[str]]] = mapped_column(JSON, nullable=True)
+    sources: Mapped[Optional[List[str]]] = mapped_column(JSONType, nullable=True)
     category: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # Question category
     user_question: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Original user question for this answer
     # response_metadata: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON, nullable=True)  # Store metadata as JSON (renamed from metadata)
@@ -57,6 +101,12 @@ class Message(Base):
 
 class UnansweredQuery(Base):
     __tablename__ = "unanswered_queries"
+    __table_args__ = (
+        Index("ix_unanswered_queries_created_id", "created_at", "id"),
+        # Analytics filters by category and orders by time; sessions look up their queries
+        Index("ix_unanswered_category_created", "category", "created_at"),
+        Index("ix_unanswered_session", "session_id"),
+    )
     
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
@@ -65,5 +115,30 @@ class UnansweredQuery(Base):
     score = Column(Float, nullable=True)  # NEW
     category = Column(String(50), nullable=True)  # Question category
     created_at = Column(DateTime, default=datetime.utcnow)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=True) 
-    sources = Column(JSON, nullable=True) 
\ No newline at end of file
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="SET NULL"), nullable=True)
+    sources = Column(JSONType, nullable=True) 
+
+
+# ---------- Full-text search ----------
+# Postgres expression GIN indexes over to_tsvector(); queries must build the exact
+# same expression (see search_vector) for the planner to use them.
+
+def search_vector(*columns):
+    """to_tsvector('english', ...) over the given text columns, NULLs treated as ''."""
+    document = func.coalesce(columns[0], text("''"))
+    for column in columns[1:]:
+        document = document.op("||")(text("' '")).op("||")(func.coalesce(column, text("''")))
+    return func.to_tsvector(text("'english'"), document)
+
+def matches_search(query: str, *columns):
+    """Full-text match on Postgres; a plain substring match on other (dev) backends."""
+    if engine.dialect.name == "postgresql":
+        return search_vector(*columns).op("@@")(func.plainto_tsquery(text("'english'"), query))
+    return or_(*(column.ilike(f"%{query}%") for column in columns))
+
+Index(
+    "ix_messages_search", search_vector(Message.content, Message.user_question), postgresql_using="gin"
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_unanswered_queries_search", search_vector(UnansweredQuery.text), postgresql_using="gin"
+).ddl_if(dialect="postgresql")
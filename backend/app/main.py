@@ -1,13 +1,28 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from .api.v1.admin import router as admin_router
 from .api.v1.auth import router as auth_router
-from .api.v1.chat import router as chat_router
-from .api.v1.preview import router as preview_router
+from .api.v1.chat import router as chat_router, load_encoding
+from .api.v1.preview import router as preview_router, close_client as close_preview_client
+from .services.categorization import close_client as close_openai_client
+from .services.rag import warmup as warmup_rag
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.gather(asyncio.to_thread(warmup_rag), asyncio.to_thread(load_encoding))
+    yield
+    await close_preview_client()
+    await close_openai_client()
 
 
-app = FastAPI(title="MedHelp Chatbot – Pre‑Beta")
+# orjson serializes the large analytics/chat payloads (and their datetimes) natively
+app = FastAPI(title="MedHelp Chatbot – Pre‑Beta", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # --- CORS: allow your Vite dev server ---
 app.add_middleware(
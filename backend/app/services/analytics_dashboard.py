@@ -73,6 +73,7 @@ max_age = st.sidebar.number_input("Max Age", min_value=0, max_value=120, value=0
 rag_score_min = st.sidebar.number_input("Min RAG Score", value=0.0)
 rag_score_max = st.sidebar.number_input("Max RAG Score", value=0.0)
 reason = st.sidebar.text_input("Reason (for unanswered)")
+search = st.sidebar.text_input("Search question/answer text")
 category = st.sidebar.selectbox("Category", ["All"] + ["Symptoms & Diagnosis", "Treatment & Medication", "Prevention & Lifestyle"])
 
 params = {"answered": answered}
@@ -98,41 +99,42 @@ if not answered and reason:
     params["reason"] = reason
 if category != "All":
     params["category"] = category
+if search:
+    params["q"] = search
 
 # --- Fetch Data ---
 with st.spinner("Fetching data..."):
-    resp = requests.get(API_URL, headers={"Authorization": f"Bearer {st.session_state['token']}"}, params=params)
-    if resp.status_code == 200:
-        data = resp.json()
-        if not data:
-            st.info("No data found for the selected filters.")
+    # The API is keyset-paginated; follow next_cursor until every page is loaded
+    data = []
+    cursor = {}
+    while True:
+        resp = requests.get(API_URL, headers={"Authorization": f"Bearer {st.session_state['token']}"}, params={**params, **cursor, "limit": 1000})
+        if resp.status_code != 200:
+            st.error(f"Failed to fetch data: {resp.status_code} {resp.text}")
             st.stop()
-        df = pd.DataFrame(data)
-    else:
-        st.error(f"Failed to fetch data: {resp.status_code} {resp.text}")
+        page = resp.json()
+        data.extend(page["results"])
+        if not page["next_cursor"]:
+            break
+        cursor = page["next_cursor"]
+    if not data:
+        st.info("No data found for the selected filters.")
         st.stop()
+    df = pd.DataFrame(data)
 
 # --- Data Processing ---
 if "date_of_birth" in df.columns:
     today = datetime.date.today()
-    def calc_age(dob):
-        try:
-            return today.year - int(dob[:4])
-        except:
-            return None
-    df["age"] = df["date_of_birth"].apply(calc_age)
+    # Vectorized: year is the first 4 characters of the ISO date, NaN if missing or malformed
+    birth_year = pd.to_numeric(df["date_of_birth"].astype("string").str[:4], errors="coerce")
+    df["age"] = today.year - birth_year
 
 # --- Normalize sources column for Arrow compatibility ---
 if "sources" in df.columns:
-    def normalize_sources(val):
-        if val is None:
-            return []
-        if isinstance(val, list):
-            return val
-        if isinstance(val, str):
-            return [val]
-        return []
-    df["sources"] = df["sources"].apply(normalize_sources)
+    df["sources"] = [
+        val if isinstance(val, list) else [val] if isinstance(val, str) else []
+        for val in df["sources"]
+    ]
 
 # --- Display Table ---
 st.subheader("Results Table")
@@ -1,63 +1,203 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from datetime import datetime, timedelta
-from typing import Annotated
+from typing import Annotated, Optional
 
 import bcrypt
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import jwt
-from sqlalchemy import select            # ← add this line
+import jwt
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import get_settings
-from ..db.models import SessionLocal, User
+from ..db.models import get_db, User
 
 
 settings = get_settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
+# Verified tokens, keyed by SHA-256 of the raw token -> (user_id, exp).
+# Repeat requests with the same bearer token skip the signature check;
+# only successful validations are cached.
+JWT_CACHE_TTL = 30
+_jwt_cache: TTLCache[bytes, tuple[int, int]] = TTLCache(maxsize=10_000, ttl=JWT_CACHE_TTL)
+
+_JWT_KEY = settings.jwt_secret.encode()
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Read-only snapshot of the authenticated user's row (everything but the password hash)."""
+    id: int
+    email: str
+    is_admin: bool
+    full_name: Optional[str]
+    date_of_birth: Optional[str]
+    gender: Optional[str]
+    sex: Optional[str]
+    country: Optional[str]
+    address: Optional[str]
+    ethnic_group: Optional[str]
+    long_term_conditions: Optional[str]
+    medications: Optional[str]
+    consent_to_data_storage: bool
+
+_CURRENT_USER_COLUMNS = [getattr(User, f.name) for f in fields(CurrentUser)]
+
+# Users behind recently seen tokens, by id. Snapshots rather than ORM objects, so
+# they are shared safely across requests and sessions; anything that changes a
+# user must call invalidate_user().
+USER_CACHE_TTL = 60
+_user_cache: TTLCache[int, CurrentUser] = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Forget a cached user so the next request reloads it from the database."""
+    _user_cache.pop(user_id, None)
+
+
+def _hash_pw(raw_pw: str) -> bytes:
+    return bcrypt.hashpw(raw_pw.encode(), bcrypt.gensalt(rounds=settings.bcrypt_rounds))
+
+
+def _verify_pw(raw_pw: str, hashed: bytes) -> bool:
+    return bcrypt.checkpw(raw_pw.encode(), hashed)
+
+
+# bcrypt releases the GIL, so a pool sized to the CPU count hashes in parallel
+# without competing with other to_thread work (e.g. RAG calls) for the default executor
+_bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
 
-async def get_user_by_email(email: str) -> User | None:
-    async with SessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.email == email)  # type: ignore
-        )
-        return result.scalar_one_or_none()
 
+# Verified against when the email is unknown, so both failure paths pay the
+# same bcrypt cost and response time doesn't reveal which accounts exist
+_DUMMY_HASH = _hash_pw("x")
 
-def _hash_pw(raw_pw: str) -> str:
-    return bcrypt.hashpw(raw_pw.encode(), bcrypt.gensalt()).decode()
 
+async def hash_password(raw_pw: str) -> bytes:
+    return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, _hash_pw, raw_pw)
 
-def _verify_pw(raw_pw: str, hashed: str) -> bool:
-    return bcrypt.checkpw(raw_pw.encode(), hashed.encode())
+
+async def verify_password(raw_pw: str, hashed: bytes) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, _verify_pw, raw_pw, hashed)
+
+
+TOKEN_LIFETIME = timedelta(days=7)
+
+
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+_HS256_HEADER = _b64url_encode(orjson.dumps({"alg": "HS256", "typ": "JWT"}))
+
+
+def _encode_hs256(payload: dict) -> str:
+    signing_input = _HS256_HEADER + b"." + _b64url_encode(orjson.dumps(payload))
+    signature = hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url_encode(signature)).decode()
 
 
 def _create_token(user_id: int) -> str:
+    if settings.jwt_alg == "HS256":
+        return _encode_hs256({"sub": str(user_id), "exp": int(time.time() + TOKEN_LIFETIME.total_seconds())})
     payload = {
         "sub": str(user_id),
-        "exp": datetime.utcnow() + timedelta(days=7),
+        "exp": datetime.utcnow() + TOKEN_LIFETIME,
     }
     return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_alg)
 
 
-async def authenticate(email: str, password: str) -> str:
-    user = await get_user_by_email(email)
-    if not user or not _verify_pw(password, user.hashed_pw):
+async def authenticate(db: AsyncSession, email: str, password: str) -> str:
+    # Only the columns needed to check the password; no User hydration
+    result = await db.execute(
+        select(User.id, User.hashed_pw).where(User.email == email)  # type: ignore
+    )
+    user = result.one_or_none()
+    ok = await verify_password(password, user.hashed_pw if user else _DUMMY_HASH)
+    if not user or not ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     return _create_token(user.id)
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+
+def _verify_hs256(token: str) -> dict:
+    """Verify an HS256 token we issued and return its payload.
+
+    A direct HMAC-SHA256 check (OpenSSL via hmac) plus orjson, without the
+    generic JWS machinery; raises ValueError on any malformed, forged or
+    expired token.
+    """
+    signing_input, _, signature = token.encode().rpartition(b".")
+    header, _, payload = signing_input.partition(b".")
+    if not header or not payload or b"." in payload:
+        raise ValueError("malformed token")
+    if orjson.loads(_b64url_decode(header)).get("alg") != "HS256":
+        raise ValueError("unexpected algorithm")
+    expected = hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, _b64url_decode(signature)):
+        raise ValueError("bad signature")
+    claims = orjson.loads(_b64url_decode(payload))
+    if not isinstance(claims.get("exp"), (int, float)) or claims["exp"] <= time.time():
+        raise ValueError("expired token")
+    if "sub" not in claims:
+        raise ValueError("missing sub")
+    return claims
+
+
+def _decode_token(token: str) -> int:
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _jwt_cache.get(key)
+    if cached is not None:
+        user_id, exp = cached
+        if exp > time.time():
+            return user_id
+        del _jwt_cache[key]
+
+    if settings.jwt_alg == "HS256":
+        payload = _verify_hs256(token)
+    else:
+        payload = jwt.decode(
+            token,
+            settings.jwt_secret,
+            algorithms=[settings.jwt_alg],
+            options={"require": ["exp", "sub"]},
+        )
+    user_id = int(payload["sub"])
+    _jwt_cache[key] = (user_id, int(payload["exp"]))
+    return user_id
+
+
+async def get_current_user(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: Annotated[AsyncSession, Depends(get_db)],
+) -> CurrentUser:
     try:
-        payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_alg])
-        user_id = int(payload["sub"])
+        user_id = _decode_token(token)
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-    async with SessionLocal() as db:
-        user = await db.get(User, user_id)
-        if user is None:
+    user = _user_cache.get(user_id)
+    if user is None:
+        # Plain columns, not an entity: nothing lands in the session's identity
+        # map, so routes that modify the user load and own their row
+        row = (await db.execute(select(*_CURRENT_USER_COLUMNS).where(User.id == user_id))).first()
+        if row is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
-        return user
+        user = CurrentUser(*row)
+        _user_cache[user_id] = user
+    return user
 
 
 def get_current_admin(user=Depends(get_current_user)):
@@ -1,12 +1,50 @@
 """Question categorization service using LLM to classify questions into consistent categories."""
-import os
-from typing import List, Optional
+import asyncio
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import httpx
 import openai
-from dotenv import load_dotenv
+import orjson
 
-load_dotenv(override=True)
+from ..core.config import get_settings
 
-openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# Built on first use so workers that never categorize skip the client/TLS setup;
+# the explicit pool keeps connections alive across batched calls
+_client: openai.AsyncOpenAI | None = None
+
+def get_client() -> openai.AsyncOpenAI:
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            max_retries=2,
+            timeout=10,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            ),
+        )
+    return _client
+
+async def close_client() -> None:
+    """Close the shared client; called on application shutdown"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+# Upper bound on in-flight categorization requests; past this, latency is
+# dominated by the rate limit rather than parallelism.
+MAX_CONCURRENT_CATEGORIZATIONS = 48
+_categorize_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CATEGORIZATIONS)
 
 # Define consistent categories for all questions
 ALL_CATEGORIES = [
@@ -23,92 +61,288 @@ BASE_CATEGORIES = [
     "Prevention & Lifestyle",
     "General"
 ]
+_BASE_CATEGORY_SET = frozenset(BASE_CATEGORIES)
+
+CATEGORIZATION_PROMPT = """You are a medical question categorizer. Reply with JSON {"c": category, "d": condition}.
 
-CATEGORIZATION_PROMPT = """
-You are a medical question categorizer. For each question, determine if it's medical/health-related or general conversation.
+c is one of: Symptoms & Diagnosis, Treatment & Medication, Prevention & Lifestyle, General.
+- Medical questions (diseases, conditions, symptoms, treatments, medications, health, medical procedures) get one of the first three.
+- "What is [disease/condition]?" is Symptoms & Diagnosis.
+- Non-medical questions are General.
+d is the specific disease or condition the question is about, in title case, or null if there is none.
+Be consistent across similar questions.
 
-For MEDICAL questions, return:
-- The main category (choose one: Symptoms & Diagnosis, Treatment & Medication, Prevention & Lifestyle)
-- If the question is about a specific disease or condition, add it after a comma (e.g. Symptoms & Diagnosis, Diabetes)
-- If not about a specific disease/condition, just return the category
+Examples:
+"What is diabetes?" → {"c": "Symptoms & Diagnosis", "d": "Diabetes"}
+"How is diabetes treated?" → {"c": "Treatment & Medication", "d": "Diabetes"}
+"How can I prevent diabetes?" → {"c": "Prevention & Lifestyle", "d": "Diabetes"}
+"What medications are used for high blood pressure?" → {"c": "Treatment & Medication", "d": "High Blood Pressure"}
+"How can I sleep better?" → {"c": "Prevention & Lifestyle", "d": null}
+"Tell me a joke" → {"c": "General", "d": null}"""
 
-For NON-MEDICAL questions, return: General
+_CATEGORY_PROPERTIES = {
+    "c": {"type": "string", "enum": BASE_CATEGORIES},
+    "d": {"type": ["string", "null"]},
+}
 
-Available categories:
-1. Symptoms & Diagnosis
-2. Treatment & Medication
-3. Prevention & Lifestyle
-4. General
+_CATEGORY_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "category",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": _CATEGORY_PROPERTIES,
+            "required": ["c", "d"],
+            "additionalProperties": False,
+        },
+    },
+}
 
-Rules:
-- Medical questions include: diseases, conditions, symptoms, treatments, medications, health, medical procedures, etc.
-- "What is [disease/condition]?" questions are MEDICAL and should be categorized as "Symptoms & Diagnosis"
-- Always return the category first
-- If a disease/condition is mentioned, add it after a comma
-- If not, just return the category
-- Be consistent across similar questions
-- Return ONLY the category (and disease/condition if present), nothing else
+# Questions sent per request by categorize_questions
+CATEGORIZATION_BATCH_SIZE = 16
 
-Examples:
-"What is diabetes?" → "Symptoms & Diagnosis, Diabetes"
-"What are the symptoms of diabetes?" → "Symptoms & Diagnosis, Diabetes"
-"How is diabetes treated?" → "Treatment & Medication, Diabetes"
-"How can I prevent diabetes?" → "Prevention & Lifestyle, Diabetes"
-"What medications are used for high blood pressure?" → "Treatment & Medication, High Blood Pressure"
-"What causes migraines?" → "Symptoms & Diagnosis, Migraines"
-"How can I lower my cholesterol naturally?" → "Prevention & Lifestyle, Cholesterol"
-"Tell me a joke" → "General"
-"What's the weather like?" → "General"
-"What is leptospirosis?" → "Symptoms & Diagnosis, Leptospirosis"
-
-Question: "{question}"
-Category:"""
-
-def categorize_question(question: str) -> Optional[str]:
+BATCH_CATEGORIZATION_PROMPT = CATEGORIZATION_PROMPT + """
+
+You will be given numbered questions. Reply with {"results": [...]} holding one
+{"i": number, "c": category, "d": condition} object per question."""
+
+_BATCH_CATEGORY_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "categories",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"i": {"type": "integer"}, **_CATEGORY_PROPERTIES},
+                        "required": ["i", "c", "d"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["results"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Greetings, thanks and other small talk that is always "General"; matched
+# against the normalized question before falling back to the LLM.
+_SMALL_TALK_RE = re.compile(
+    r"^(?:hi|hello|hey|hiya|yo|good (?:morning|afternoon|evening|night)"
+    r"|thanks|thank you(?: so much| very much)?|thx|ty|cheers"
+    r"|ok|okay|cool|great|bye|goodbye|see you(?: later)?"
+    r"|how are you(?: doing)?|who are you|what(?: is|'s) your name"
+    r"|tell me a joke|what(?: is|'s) the weather(?: like)?(?: today)?)"
+    r"(?:[\s,!.]+(?:there|kyra|again))*$"
+)
+
+CATEGORIZATION_MODEL = "gpt-4o-mini"  # Use mini for cost efficiency
+
+CATEGORY_CACHE_SIZE = 20_000
+_category_cache: OrderedDict[str, str] = OrderedDict()
+
+# Optional on-disk layer behind the in-memory cache, keyed by SHA-256 of model and question.
+# Lookups use a reader connection on the event loop (WAL readers never wait on the
+# writer); writes go through a separate connection in a worker thread, one
+# transaction per categorization request.
+_disk_reader: sqlite3.Connection | None = None
+_disk_writer: sqlite3.Connection | None = None
+_disk_write_lock = threading.Lock()
+
+def _connect_disk_cache() -> sqlite3.Connection:
+    conn = sqlite3.connect(settings.category_cache_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS categories (key TEXT PRIMARY KEY, category TEXT NOT NULL)")
+    conn.commit()
+    return conn
+
+def _get_disk_cache() -> Optional[sqlite3.Connection]:
+    global _disk_reader
+    if _disk_reader is None and settings.category_cache_path:
+        _disk_reader = _connect_disk_cache()
+    return _disk_reader
+
+def _write_disk_cache(rows: List[Tuple[str, str]]) -> None:
+    """Store (key, category) rows in one transaction; runs in a worker thread."""
+    global _disk_writer
+    with _disk_write_lock:
+        if _disk_writer is None:
+            _disk_writer = _connect_disk_cache()
+        with _disk_writer:
+            _disk_writer.executemany("INSERT OR REPLACE INTO categories (key, category) VALUES (?, ?)", rows)
+
+async def _persist(entries: List[Tuple[str, str]]) -> None:
+    """Write freshly categorized (question, category) pairs through to the on-disk cache."""
+    if not entries or not settings.category_cache_path:
+        return
+    try:
+        await asyncio.to_thread(_write_disk_cache, [(_disk_key(q), category) for q, category in entries])
+    except sqlite3.Error as e:
+        logger.warning("Could not persist %d categories: %s", len(entries), e)
+
+def _disk_key(question: str) -> str:
+    return hashlib.sha256(f"{CATEGORIZATION_MODEL}\0{question}".encode()).hexdigest()
+
+
+def _normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation so trivially different phrasings share a cache entry."""
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+def _local_category(question: str) -> Optional[str]:
+    """Categorize obvious small talk without an LLM call; None means ask the model."""
+    if _SMALL_TALK_RE.match(question):
+        return "General"
+    return None
+
+def _cache_get(question: str) -> Optional[str]:
+    category = _category_cache.get(question)
+    if category is not None:
+        _category_cache.move_to_end(question)
+        return category
+    
+    disk = _get_disk_cache()
+    if disk is not None:
+        row = disk.execute("SELECT category FROM categories WHERE key = ?", (_disk_key(question),)).fetchone()
+        if row is not None:
+            _cache_put(question, row[0])
+            return row[0]
+    return None
+
+def _cache_put(question: str, category: str) -> None:
+    _category_cache[question] = category
+    _category_cache.move_to_end(question)
+    if len(_category_cache) > CATEGORY_CACHE_SIZE:
+        _category_cache.popitem(last=False)
+
+def _category_from_json(result: dict, question: str) -> str:
+    """Join a structured {"c", "d"} answer into "Category, Condition", defaulting to "General"."""
+    category = result.get("c")
+    if category not in _BASE_CATEGORY_SET:
+        logger.debug("Unexpected category response %r for question %r", result, question)
+        return "General"
+    condition = result.get("d")
+    if condition and category != "General":
+        category = f"{category}, {condition}"
+    logger.debug("Question categorized as %r for question %r", category, question)
+    return category
+
+async def _categorize_normalized(question: str) -> str:
+    """
+    Categorize an already-normalized question via the LLM.
+    
+    Raises on API errors so that failures are never cached.
+    """
+    cached = _local_category(question) or _cache_get(question)
+    if cached is not None:
+        return cached
+
+    logger.debug("Calling OpenAI API for question %r", question)
+    async with _categorize_semaphore:
+        response = await get_client().chat.completions.create(
+            model=CATEGORIZATION_MODEL,
+            messages=[
+                {"role": "system", "content": CATEGORIZATION_PROMPT},
+                {"role": "user", "content": question},
+            ],
+            response_format=_CATEGORY_FORMAT,
+            max_tokens=50,  # Room for disease/condition names
+            temperature=0.1  # Low temperature for consistent categorization
+        )
+    
+    content = response.choices[0].message.content
+    logger.debug("Raw OpenAI response: %r", content)
+    
+    category = _category_from_json(orjson.loads(content), question)
+    _cache_put(question, category)
+    await _persist([(question, category)])
+    return category
+
+async def _categorize_batch(questions: List[str]) -> List[Optional[str]]:
+    """
+    Categorize already-normalized questions with a single LLM request.
+    
+    Questions missing from the response come back as None.
+    """
+    numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+    logger.debug("Calling OpenAI API for %d questions", len(questions))
+    async with _categorize_semaphore:
+        response = await get_client().chat.completions.create(
+            model=CATEGORIZATION_MODEL,
+            messages=[
+                {"role": "system", "content": BATCH_CATEGORIZATION_PROMPT},
+                {"role": "user", "content": numbered},
+            ],
+            response_format=_BATCH_CATEGORY_FORMAT,
+            max_tokens=40 * len(questions),
+            temperature=0.1
+        )
+
+    results: List[Optional[str]] = [None] * len(questions)
+    for result in orjson.loads(response.choices[0].message.content)["results"]:
+        idx = result.get("i", 0) - 1
+        if 0 <= idx < len(questions) and results[idx] is None:
+            category = _category_from_json(result, questions[idx])
+            _cache_put(questions[idx], category)
+            results[idx] = category
+    await _persist([(q, category) for q, category in zip(questions, results) if category is not None])
+    return results
+
+async def categorize_question(question: str) -> Optional[str]:
     """
     Categorize a question into one of the predefined categories.
     
+    Results are cached by normalized question text, since categories are stable
+    and repeated questions are common.
+    
     Args:
         question: The question to categorize
         
     Returns:
         Category name (with disease/condition if applicable) or None if categorization fails
     """
-    print(f"[DEBUG] Starting categorization for question: '{question}'")
-    
     try:
-        print(f"[DEBUG] Calling OpenAI API...")
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",  # Use mini for cost efficiency
-            messages=[
-                {"role": "user", "content": CATEGORIZATION_PROMPT.format(question=question)}
-            ],
-            max_tokens=50,  # Increased to accommodate disease/condition names
-            temperature=0.1  # Low temperature for consistent categorization
-        )
-        
-        category = response.choices[0].message.content.strip()
-        print(f"[DEBUG] Raw OpenAI response: '{category}'")
-        
-        # Validate that the response starts with one of our expected base categories
-        for base_category in BASE_CATEGORIES:
-            if category.startswith(base_category):
-                print(f"[DEBUG] Question categorized as: '{category}' for question: '{question}'")
-                return category
-        
-        # If no base category matches, check if it's just a base category
-        if category in BASE_CATEGORIES:
-            print(f"[DEBUG] Question categorized as: '{category}' for question: '{question}'")
-            return category
-        
-        print(f"[DEBUG] Unexpected category response: '{category}' for question: '{question}'")
-        # Default to General if response is unexpected
-        return "General"
-            
+        return await _categorize_normalized(_normalize_question(question))
     except Exception as e:
-        print(f"[DEBUG] Categorization error for question '{question}': {e}")
+        logger.warning("Categorization error for question %r: %s", question, e)
         return None
 
+async def categorize_questions(questions: List[str]) -> List[Optional[str]]:
+    """
+    Categorize many questions, packing up to CATEGORIZATION_BATCH_SIZE into each LLM request.
+    
+    Cached questions and duplicates are not sent again; batches run concurrently.
+    
+    Args:
+        questions: The questions to categorize
+        
+    Returns:
+        One category per question, in order; None where categorization failed
+    """
+    normalized = [_normalize_question(q) for q in questions]
+    categories = {q: _local_category(q) or _cache_get(q) for q in normalized}
+    pending = [q for q, category in categories.items() if category is None]
+
+    batches = [
+        pending[start:start + CATEGORIZATION_BATCH_SIZE]
+        for start in range(0, len(pending), CATEGORIZATION_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(
+        *(_categorize_batch(batch) for batch in batches), return_exceptions=True
+    )
+    for batch, result in zip(batches, results):
+        if isinstance(result, BaseException):
+            logger.warning("Batch categorization error for %d questions: %s", len(batch), result)
+            continue
+        categories.update(zip(batch, result))
+
+    return [categories[q] for q in normalized]
+
 def get_available_categories() -> List[str]:
     """Get the list of available categories for reference."""
     return ALL_CATEGORIES.copy()
@@ -1,21 +1,30 @@
 """RAG helper functions with hybrid GPT-4o conversation system."""
 from __future__ import annotations
-import os
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Dict, Any, Union
+import numpy as np
 import openai
 from chromadb import PersistentClient
-from llama_index.core import Settings, VectorStoreIndex
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.llms.openai import OpenAI
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from dotenv import load_dotenv
-load_dotenv(override=True)
+
+from ..core.config import get_settings
+from .categorization import get_client as get_openai_client
 # --------------------------------------------------------------------------- #
 # Configuration
 # --------------------------------------------------------------------------- #
-openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
+settings = get_settings()
 SIM_THRESHOLD: float = 0.30  # minimum similarity to use RAG knowledge
+TRUSTED_DOMAINS = ("nhs.uk", "cancerresearchuk.org")  # only sources from these are cited
 
 INDEX_DIR = (
     Path(__file__)
@@ -25,68 +34,127 @@ INDEX_DIR = (
 ).resolve()
 
 # --------------------------------------------------------------------------- #
-# Initialise Chroma-powered query engine (loads once per worker)
+# Clients and Chroma collections (created once per worker, on first use rather
+# than at import; warmup() does it at startup)
 # --------------------------------------------------------------------------- #
-chroma_client = PersistentClient(path=str(INDEX_DIR))
+@dataclass
+class RagState:
+    openai_client: openai.OpenAI
+    nhs_collection: Any
+    cancer_collection: Any
+    # Collection name -> in-memory copy, for collections small enough (built by warmup())
+    dense_indexes: Dict[str, _DenseIndex] = field(default_factory=dict)
 
-# Try to get both collections - NHS and Cancer Research UK
-nhs_collection = chroma_client.get_or_create_collection("nhs_docs")
-cancer_collection = chroma_client.get_or_create_collection("cancer_research_docs")
+@lru_cache(maxsize=None)
+def get_rag_state() -> RagState:
+    chroma_client = PersistentClient(path=str(INDEX_DIR))
+    return RagState(
+        openai_client=openai.OpenAI(api_key=settings.openai_api_key),
+        nhs_collection=chroma_client.get_or_create_collection("nhs_docs"),
+        cancer_collection=chroma_client.get_or_create_collection("cancer_research_docs"),
+    )
 
-# Create vector stores for both collections
-nhs_store = ChromaVectorStore(chroma_collection=nhs_collection, stores_text=True)
-cancer_store = ChromaVectorStore(chroma_collection=cancer_collection, stores_text=True)
+# --------------------------------------------------------------------------- #
+# Medical question classifier
+# --------------------------------------------------------------------------- #
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
 
-Settings.embed_model = OpenAIEmbedding(model="text-embedding-3-small")
-Settings.llm = OpenAI(model="gpt-4o-mini", temperature=0.2)  # Keep for RAG retrieval
+# Questions are classified by whichever set holds their nearest neighbour in
+# embedding space, which costs one embedding call instead of a GPT-4o completion
+MEDICAL_PROTOTYPES = [
+    "What is diabetes?",
+    "I have a headache, what should I do?",
+    "How to treat high blood pressure?",
+    "What are the symptoms of flu?",
+    "My medication side effects",
+    "Cancer treatment options",
+    "Is this rash serious?",
+    "What causes chest pain?",
+    "How can I lower my cholesterol?",
+    "I've had a cough for three weeks",
+    "Can I take ibuprofen with paracetamol?",
+    "What are the early signs of dementia?",
+    "How do I know if I have depression?",
+    "Is it safe to exercise while pregnant?",
+    "My child has a fever",
+    "What does a high blood sugar reading mean?",
+    "How is asthma diagnosed?",
+    "Should I be worried about a lump in my breast?",
+    "How much sleep do adults need?",
+    "Is this serious?",
+]
 
-# Create indices for both collections
-nhs_index = VectorStoreIndex.from_vector_store(nhs_store)
-cancer_index = VectorStoreIndex.from_vector_store(cancer_store)
+GENERAL_PROTOTYPES = [
+    "Hello",
+    "How are you?",
+    "What's the weather like?",
+    "Tell me a joke",
+    "Thanks for your help",
+    "Who are you?",
+    "What can you do?",
+    "Good morning",
+    "What's the capital of France?",
+    "Write me a poem",
+    "Recommend a good film",
+    "What time is it?",
+    "Can you help me with my homework?",
+    "What's the latest football score?",
+    "How do I cook pasta?",
+    "Translate this into Spanish",
+    "Goodbye",
+    "What is your name?",
+    "Tell me something interesting",
+    "How do I reset my password?",
+]
 
-# Create query engines for both collections
-nhs_query_engine = nhs_index.as_query_engine(similarity_top_k=3)
-cancer_query_engine = cancer_index.as_query_engine(similarity_top_k=3)
+# SHA-256 of the text -> L2-normalized embedding, least recently used first.
+# Follow-ups re-embed the same recent history, so repeats are common.
+EMBEDDING_CACHE_SIZE = 4096
+_embedding_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+_embedding_cache_lock = threading.Lock()  # _embed runs in worker threads
 
-# --------------------------------------------------------------------------- #
-# Medical question classifier
-# --------------------------------------------------------------------------- #
-MEDICAL_CLASSIFIER_PROMPT = """
-You are a classifier that determines if a question is medical/health-related or general conversation.
-
-Return only "MEDICAL" or "GENERAL".
-
-Examples:
-"Hello" -> GENERAL
-"How are you?" -> GENERAL  
-"What's the weather like?" -> GENERAL
-"Tell me a joke" -> GENERAL
-"What is diabetes?" -> MEDICAL
-"I have a headache, what should I do?" -> MEDICAL
-"How to treat high blood pressure?" -> MEDICAL
-"What are the symptoms of flu?" -> MEDICAL
-"My medication side effects" -> MEDICAL
-"Cancer treatment options" -> MEDICAL
-
-Question: "{question}"
-Classification:"""
-
-def is_medical_question(question: str) -> bool:
-    """Classify if a question is medical/health-related using GPT-4o"""
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": MEDICAL_CLASSIFIER_PROMPT.format(question=question)}
-            ],
-            max_tokens=10,
-            temperature=0
+def _embed(texts: List[str]) -> np.ndarray:
+    """Embed texts, calling the API once for any not already cached; rows are L2-normalized."""
+    keys = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+    vectors: List[Optional[np.ndarray]] = []
+    with _embedding_cache_lock:
+        for key in keys:
+            vector = _embedding_cache.get(key)
+            if vector is not None:
+                _embedding_cache.move_to_end(key)
+            vectors.append(vector)
+    
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        response = get_rag_state().openai_client.embeddings.create(
+            model=EMBEDDING_MODEL, input=[texts[i] for i in missing]
         )
-        
-        classification = response.choices[0].message.content.strip().upper()
-        return classification == "MEDICAL"
+        fresh = np.array([item.embedding for item in response.data], dtype=np.float32)
+        fresh /= np.linalg.norm(fresh, axis=1, keepdims=True)
+        with _embedding_cache_lock:
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                _embedding_cache[keys[i]] = vector
+                _embedding_cache.move_to_end(keys[i])
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    return np.stack(vectors)
+
+@lru_cache(maxsize=1)
+def _prototype_embeddings() -> Tuple[np.ndarray, np.ndarray]:
+    """(medical, general) prototype matrices, embedded once on first use."""
+    vectors = _embed(MEDICAL_PROTOTYPES + GENERAL_PROTOTYPES)
+    return vectors[:len(MEDICAL_PROTOTYPES)], vectors[len(MEDICAL_PROTOTYPES):]
+
+def is_medical_question(question: str, embedding: Optional[np.ndarray] = None) -> bool:
+    """Classify if a question is medical/health-related by nearest prototype"""
+    try:
+        medical, general = _prototype_embeddings()
+        query = embedding if embedding is not None else _embed([question])[0]
+        return float((medical @ query).max()) >= float((general @ query).max())
     except Exception as e:
-        print(f"[DEBUG] Classification error: {e}")
+        logger.warning("Classification error: %s", e)
         # Default to medical if classifier fails - safer approach
         return True
 
@@ -96,128 +164,231 @@ def is_medical_question(question: str) -> bool:
 # --------------------------------------------------------------------------- #
 # RAG retrieval function with exponential weighting
 # --------------------------------------------------------------------------- #
-def get_rag_context_weighted(
+def _contextual_query(current_query: str, conversation_history: Optional[List[Dict[str, str]]]) -> Optional[str]:
+    """Lightweight contextual query from the last 2 messages, or None without history."""
+    if not conversation_history:
+        return None
+    recent_context = []
+    for msg in conversation_history[-2:]:  # Only last 2 messages for context
+        recent_context.append(f"{msg['role']}: {msg['content']}")
+    return f"Context: {' | '.join(recent_context)} | Current: {current_query}"
+
+class _DenseIndex:
+    """
+    Exact nearest-neighbour search over a snapshot of a Chroma collection: all
+    embeddings in one contiguous matrix, scored with a single BLAS matrix product.
+    
+    Distances match the collection's configured space, so results and scores are
+    the ones Chroma would return. Chunks ingested later are only picked up on restart.
+    """
+
+    def __init__(self, collection):
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        self.vectors = np.ascontiguousarray(data["embeddings"], dtype=np.float32)  # (n, dim)
+        self.sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        self.texts: List[str] = list(data["documents"])
+        self.sources: List[str] = [(metadata or {}).get("source", "") for metadata in data["metadatas"]]
+        self.space = (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """(n_queries, n) distances in the collection's space."""
+        dots = queries @ self.vectors.T
+        if self.space == "ip":
+            return 1.0 - dots
+        if self.space == "cosine":
+            norms = np.linalg.norm(queries, axis=1)[:, None] * np.sqrt(self.sq_norms)
+            return 1.0 - dots / np.maximum(norms, 1e-12)
+        # Chroma's l2 is the squared Euclidean distance
+        return np.einsum("ij,ij->i", queries, queries)[:, None] + self.sq_norms - 2.0 * dots
+
+    def query(self, queries: np.ndarray, k: int) -> List[List[Dict[str, Any]]]:
+        distances = self.distances(np.asarray(queries, dtype=np.float32))
+        n = distances.shape[1]
+        if k < n:
+            # Unordered k nearest per query; only those k get sorted below
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.tile(np.arange(n), (len(distances), 1))
+        results = []
+        for row, candidates in zip(distances, nearest):
+            ranked = candidates[np.argsort(row[candidates])]
+            results.append([
+                {'text': self.texts[i], 'score': math.exp(-float(row[i])), 'source': self.sources[i]}
+                for i in ranked
+            ])
+        return results
+
+def _query_collection(collection, embeddings: np.ndarray, k: int = 3) -> List[List[Dict[str, Any]]]:
+    """
+    Nearest k chunks of a Chroma collection to each row of precomputed query
+    embeddings, all in one query; served from the collection's in-memory dense
+    index when it has one.
+    
+    Scores use the same exp(-distance) similarity llama_index reports for Chroma,
+    so SIM_THRESHOLD keeps its meaning.
+    """
+    dense_index = get_rag_state().dense_indexes.get(collection.name)
+    if dense_index is not None:
+        return dense_index.query(embeddings, k)
+    res = collection.query(
+        query_embeddings=embeddings.tolist(),
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+    return [
+        [
+            {'text': text, 'score': math.exp(-distance), 'source': (metadata or {}).get("source", "")}
+            for text, metadata, distance in zip(documents, metadatas, distances)
+        ]
+        for documents, metadatas, distances in zip(res["documents"], res["metadatas"], res["distances"])
+    ]
+
+def warmup() -> None:
+    """
+    Pay one-off costs before the first request: embed the classifier prototypes,
+    load small collections into dense in-memory indexes, and run a query per
+    collection so its index is loaded into memory.
+    """
+    try:
+        probe = _prototype_embeddings()[0][:1]
+    except Exception as e:
+        logger.warning("Warmup: prototype embedding error: %s", e)
+        probe = np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+    try:
+        state = get_rag_state()
+    except Exception as e:
+        logger.warning("Warmup: could not open the vector store: %s", e)
+        return
+    for collection in (state.nhs_collection, state.cancer_collection):
+        try:
+            if 0 < collection.count() <= settings.dense_index_max_rows:
+                state.dense_indexes[collection.name] = _DenseIndex(collection)
+                logger.info("Loaded %s into a dense in-memory index", collection.name)
+            _query_collection(collection, probe)
+        except Exception as e:
+            logger.warning("Warmup: %s query error: %s", collection.name, e)
+
+async def get_rag_context_weighted_async(
     current_query: str, 
     conversation_history: Optional[List[Dict[str, str]]] = None,
     primary_weight: float = 0.8,
-    context_weight: float = 0.2
+    context_weight: float = 0.2,
+    embeddings: Optional[np.ndarray] = None,
 ) -> Tuple[Optional[str], float, List[str]]:
     """
     Get RAG context using exponentially weighted queries from both NHS and Cancer Research UK collections.
     Prioritizes the current question while considering recent context.
     
+    The primary and contextual queries against both collections run concurrently,
+    so retrieval takes as long as the slowest query rather than the sum of all four.
+    
     Args:
         current_query: The current user question
         conversation_history: Recent conversation messages
         primary_weight: Weight for current query (0.8 = 80% focus on current question)
         context_weight: Weight for context query (0.2 = 20% focus on context)
+        embeddings: Precomputed embeddings of [current query, contextual query];
+            embedded here in one API call if not given
     
     Returns:
         (context_text | None, similarity_score, sources)
     """
-    print(f"[DEBUG] RAG: Using weighted approach - primary: {primary_weight}, context: {context_weight}")
-    
+    logger.debug("RAG: Using weighted approach - primary: %s, context: %s", primary_weight, context_weight)
+    
+    contextual_query = _contextual_query(current_query, conversation_history)
+    if embeddings is None:
+        texts = [current_query] if contextual_query is None else [current_query, contextual_query]
+        embeddings = await asyncio.to_thread(_embed, texts)
+    
+    # Without history the result depends only on the question (and weights)
+    cache_key = None
+    if contextual_query is None:
+        cache_key = hashlib.sha256(
+            f"{primary_weight}:{_normalize_query(current_query)}".encode()
+        ).hexdigest()
+        cached = _retrieval_cache.get(cache_key, embeddings[0])
+        if cached is not None:
+            logger.debug("RAG: Retrieval cache hit")
+            return cached
+    
+    if contextual_query is not None:
+        logger.debug("RAG: Contextual search with recent history")
+    
+    # One query per collection covers the current and contextual embeddings;
+    # Chroma queries are synchronous, so each runs in a worker thread
+    state = get_rag_state()
+    nhs_res, cancer_res = await asyncio.gather(
+        asyncio.to_thread(_query_collection, state.nhs_collection, embeddings),
+        asyncio.to_thread(_query_collection, state.cancer_collection, embeddings),
+        return_exceptions=True,
+    )
+    result = _rank_results(nhs_res, cancer_res, primary_weight, context_weight)
+    
+    # Don't remember a partial result
+    if cache_key and not isinstance(nhs_res, BaseException) and not isinstance(cancer_res, BaseException):
+        _retrieval_cache.put(cache_key, embeddings[0], result)
+    return result
+
+def _rank_results(
+    nhs_res: Union[List[List[Dict[str, Any]]], BaseException],
+    cancer_res: Union[List[List[Dict[str, Any]]], BaseException],
+    primary_weight: float,
+    context_weight: float,
+) -> Tuple[Optional[str], float, List[str]]:
+    """Weighted score, sources and context text from both collections' query results."""
     # Search both collections with current query
     all_results = []
     best_score = 0.0
-    
-    # Search NHS collection
-    try:
-        nhs_res = nhs_query_engine.query(current_query)
-        if nhs_res.source_nodes:
-            for node in nhs_res.source_nodes:
-                if node.score:
-                    all_results.append({
-                        'text': node.node.text,
-                        'score': node.score,
-                        'source': node.node.metadata.get("source", ""),
-                        'collection': 'nhs'
-                    })
-                    best_score = max(best_score, node.score)
-        print(f"[DEBUG] RAG: NHS search found {len(nhs_res.source_nodes)} results")
-    except Exception as exc:
-        print(f"[DEBUG] RAG: NHS search error: {exc}")
-    
-    # Search Cancer Research UK collection
-    try:
-        cancer_res = cancer_query_engine.query(current_query)
-        if cancer_res.source_nodes:
-            for node in cancer_res.source_nodes:
-                if node.score:
-                    all_results.append({
-                        'text': node.node.text,
-                        'score': node.score,
-                        'source': node.node.metadata.get("source", ""),
-                        'collection': 'cancer_research'
-                    })
-                    best_score = max(best_score, node.score)
-        print(f"[DEBUG] RAG: Cancer Research search found {len(cancer_res.source_nodes)} results")
-    except Exception as exc:
-        print(f"[DEBUG] RAG: Cancer Research search error: {exc}")
+    context_res = []
+    
+    for res, collection, label in ((nhs_res, 'nhs', 'NHS'), (cancer_res, 'cancer_research', 'Cancer Research')):
+        if isinstance(res, BaseException):
+            logger.warning("RAG: %s search error: %s", label, res)
+            continue
+        res, *contextual = res
+        context_res += contextual
+        for result in res:
+            if result['score']:
+                all_results.append({**result, 'collection': collection})
+                best_score = max(best_score, result['score'])
+        logger.debug("RAG: %s search found %d results", label, len(res))
     
     # If nothing retrieved from either collection
     if not all_results:
-        print(f"[DEBUG] RAG: No results from either collection")
+        logger.debug("RAG: No results from either collection")
         return None, 0.0, []
     
     # Sort results by score and take top results
     all_results.sort(key=lambda x: x['score'], reverse=True)
     top_results = all_results[:6]  # Take top 6 results total
     
-    # Build contextual query if we have conversation history
+    # Best score across both collections for the contextual query; failures just count as 0
     contextual_score = 0.0
-    if conversation_history and len(conversation_history) > 0:
-        try:
-            # Build lightweight contextual query (last 2 messages max)
-            recent_context = []
-            for msg in conversation_history[-2:]:  # Only last 2 messages for context
-                recent_context.append(f"{msg['role']}: {msg['content']}")
-            
-            contextual_query = f"Context: {' | '.join(recent_context)} | Current: {current_query}"
-            print(f"[DEBUG] RAG: Contextual search with recent history")
-            
-            # Search both collections with contextual query
-            context_results = []
-            
-            try:
-                nhs_context_res = nhs_query_engine.query(contextual_query)
-                if nhs_context_res.source_nodes:
-                    context_results.extend([node.score or 0.0 for node in nhs_context_res.source_nodes])
-            except:
-                pass
-            
-            try:
-                cancer_context_res = cancer_query_engine.query(contextual_query)
-                if cancer_context_res.source_nodes:
-                    context_results.extend([node.score or 0.0 for node in cancer_context_res.source_nodes])
-            except:
-                pass
-            
-            if context_results:
-                contextual_score = max(context_results)
-                print(f"[DEBUG] RAG: Contextual similarity = {contextual_score:.3f}")
-        except Exception as exc:
-            print(f"[DEBUG] RAG: Contextual search failed: {exc}")
-            contextual_score = 0.0
+    context_results = [result['score'] for res in context_res for result in res]
+    if context_results:
+        contextual_score = max(context_results)
+        logger.debug("RAG: Contextual similarity = %.3f", contextual_score)
     
     # Calculate weighted similarity score
     final_score = (primary_weight * best_score) + (context_weight * contextual_score)
-    print(f"[DEBUG] RAG: Weighted similarity = {final_score:.3f} (primary: {best_score:.3f}, context: {contextual_score:.3f})")
+    logger.debug(
+        "RAG: Weighted similarity = %.3f (primary: %.3f, context: %.3f)", final_score, best_score, contextual_score
+    )
     
-    # Extract sources from top results
-    links: List[str] = [
-        result['source'] for result in top_results 
-        if result['source'] and (("nhs.uk" in result['source']) or ("cancerresearchuk.org" in result['source']))
-    ]
+    # Distinct NHS / Cancer Research sources of the top results, in rank order
+    links: List[str] = list(dict.fromkeys(
+        result['source'] for result in top_results
+        if result['source'] and any(domain in result['source'] for domain in TRUSTED_DOMAINS)
+    ))
     
     # Domain filter: only NHS / Cancer Research pages
-    if not any(("nhs.uk" in url) or ("cancerresearchuk.org" in url) for url in links):
-        print(f"[DEBUG] RAG: No NHS/Cancer Research sources found")
+    if not links:
+        logger.debug("RAG: No NHS/Cancer Research sources found")
         return None, 0.0, links
     
     # Check if weighted similarity is high enough
     if final_score < SIM_THRESHOLD:
-        print(f"[DEBUG] RAG: Weighted similarity {final_score:.3f} below threshold {SIM_THRESHOLD}")
+        logger.debug("RAG: Weighted similarity %.3f below threshold %s", final_score, SIM_THRESHOLD)
         return None, final_score, links
     
     # Extract context from top results
@@ -229,6 +400,19 @@ def get_rag_context_weighted(
     context_text = "\n\n".join(context_parts) if context_parts else None
     return context_text, final_score, links
 
+def get_rag_context_weighted(
+    current_query: str, 
+    conversation_history: Optional[List[Dict[str, str]]] = None,
+    primary_weight: float = 0.8,
+    context_weight: float = 0.2
+) -> Tuple[Optional[str], float, List[str]]:
+    """
+    Synchronous wrapper around get_rag_context_weighted_async for callers without an event loop.
+    """
+    return asyncio.run(get_rag_context_weighted_async(
+        current_query, conversation_history, primary_weight, context_weight
+    ))
+
 def get_rag_context(query: str) -> Tuple[Optional[str], float, List[str]]:
     """
     Legacy function - now just calls the weighted version with current query only
@@ -249,16 +433,15 @@ def get_rag_context(query: str) -> Tuple[Optional[str], float, List[str]]:
 # --------------------------------------------------------------------------- #
 # GPT-4o conversation with optional RAG enhancement
 # --------------------------------------------------------------------------- #
-def generate_response_with_gpt4o(
+def _gpt_messages(
     messages: List[Dict[str, str]], 
     current_message: str,
     rag_context: Optional[str] = None,
-    sources: Optional[List[str]] = None,
     is_medical: bool = False,
     user_context: Optional[str] = None,
-) -> str:
+) -> List[Dict[str, str]]:
     """
-    Generate response using GPT-4o, optionally enhanced with RAG context and user context
+    Chat messages for GPT-4o: system prompt (with any RAG and user context), history, current message
     """
     
     # Build system prompt
@@ -327,27 +510,75 @@ Sources:
     gpt_messages.extend(messages)  # Add conversation history
     gpt_messages.append({"role": "user", "content": current_message})  # Add current message
     
-    print(f"[DEBUG] Sending {len(gpt_messages)} messages to GPT-4o")
-    print(f"[DEBUG] Full conversation context being sent:")
-    for i, msg in enumerate(gpt_messages):
-        print(f"  {i}. {msg['role']}: {msg['content'][:150]}...")
-    
+    logger.debug("Sending %d messages to GPT-4o", len(gpt_messages))
+    return gpt_messages
+
+GPT4O_PARAMS = {
+    "model": "gpt-4o",
+    "temperature": 0.7,  # Slightly more conversational
+    "max_tokens": 1200,  # Increased for sources
+}
+
+def generate_response_with_gpt4o(
+    messages: List[Dict[str, str]], 
+    current_message: str,
+    rag_context: Optional[str] = None,
+    sources: Optional[List[str]] = None,
+    is_medical: bool = False,
+    user_context: Optional[str] = None,
+) -> str:
+    """
+    Generate response using GPT-4o, optionally enhanced with RAG context and user context
+    """
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=gpt_messages,
-            temperature=0.7,  # Slightly more conversational
-            max_tokens=1200  # Increased for sources
+        response = get_rag_state().openai_client.chat.completions.create(
+            messages=_gpt_messages(messages, current_message, rag_context, is_medical, user_context),
+            **GPT4O_PARAMS,
         )
         
         return response.choices[0].message.content
     except Exception as e:
-        print(f"[DEBUG] GPT-4o error: {e}")
-        return "I'm having trouble responding right now. Please try again in a moment."
+        logger.warning("GPT-4o error: %s", e)
+        return FALLBACK_RESPONSE
+
+async def stream_response_with_gpt4o(
+    messages: List[Dict[str, str]], 
+    current_message: str,
+    rag_context: Optional[str] = None,
+    is_medical: bool = False,
+    user_context: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Like generate_response_with_gpt4o, but yields the response text as GPT-4o produces it.
+    
+    Yields FALLBACK_RESPONSE if the request fails before any text arrives; a failure
+    mid-stream is raised, since part of the response has already been handed out.
+    """
+    streamed = False
+    try:
+        # The timeout applies per read, i.e. between chunks
+        stream = await get_openai_client().with_options(timeout=60).chat.completions.create(
+            messages=_gpt_messages(messages, current_message, rag_context, is_medical, user_context),
+            stream=True,
+            **GPT4O_PARAMS,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                streamed = True
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        if streamed:
+            raise
+        logger.warning("GPT-4o error: %s", e)
+        yield FALLBACK_RESPONSE
 
 # --------------------------------------------------------------------------- #
 # Response formatting with sources
 # --------------------------------------------------------------------------- #
+SOURCES_HEADER_RE = re.compile(r"^[ \t]*sources:.*$", re.IGNORECASE | re.MULTILINE)
+SOURCES_SECTION_RE = re.compile(r"(?:\n[ \t]*-[^\n]*|\n[ \t\r]*(?=\n|$))*")
+SOURCE_LINE_RE = re.compile(r"^[ \t]*-([^\n]*)$", re.MULTILINE)
+
 def format_response_with_sources(
     response: str, 
     sources: List[str], 
@@ -388,31 +619,22 @@ def format_response_with_sources(
         gpt_sources = []
         
         # Try to extract sources from GPT-4o response and convert to clickable links
-        if "Sources:" in response or "sources:" in response.lower():
-            lines = response.split('\n')
-            in_sources = False
-            source_replacements = []
+        header = SOURCES_HEADER_RE.search(response)
+        if header:
+            # The section runs until the first line that is neither blank nor a "- " item
+            section = SOURCES_SECTION_RE.match(response, header.end())
             
-            for i, line in enumerate(lines):
-                line_stripped = line.strip()
-                if line_stripped.lower().startswith('sources:'):
-                    in_sources = True
-                    continue
-                if in_sources and line_stripped.startswith('-'):
-                    source_text = line_stripped[1:].strip()
-                    gpt_sources.append(source_text)
-                    
-                    # Try to convert text sources to clickable links
-                    clickable_link = convert_text_source_to_link(source_text)
-                    if clickable_link != source_text:
-                        # Replace the original line with a clickable link
-                        source_replacements.append((line, f"- {clickable_link}"))
-                elif in_sources and line_stripped and not line_stripped.startswith('-'):
-                    break
+            def link_source(match: re.Match) -> str:
+                source_text = match.group(1).strip()
+                gpt_sources.append(source_text)
+                clickable_link = convert_text_source_to_link(source_text)
+                return f"- {clickable_link}" if clickable_link != source_text else match.group(0)
             
-            # Apply source replacements to make them clickable
-            for old_line, new_line in source_replacements:
-                response = response.replace(old_line, new_line)
+            response = (
+                response[:section.start()]
+                + SOURCE_LINE_RE.sub(link_source, section.group())
+                + response[section.end():]
+            )
         
         # Remove duplicates from GPT-4o sources
         unique_gpt_sources = list(dict.fromkeys(gpt_sources)) if gpt_sources else []
@@ -426,127 +648,208 @@ def format_response_with_sources(
         
         return response, unique_gpt_sources if unique_gpt_sources else sources
 
+_SLUG_TRANS = str.maketrans({' ': '-', ',': None, '(': None, ')': None})
+_COMPACT_SLUG_TRANS = str.maketrans({' ': None, ',': None, '(': None, ')': None})
+
+def _slug(topic: str) -> str:
+    return topic.lower().translate(_SLUG_TRANS)
+
+_CANCER_RESEARCH_UK = (
+    "https://www.cancerresearchuk.org/",
+    lambda topic: f"https://www.cancerresearchuk.org/about-cancer/{_slug(topic)}",
+)
+
+# Marker in the lower-cased source text -> (home page, topic page builder),
+# checked in order
+SOURCE_LINKS: Dict[str, Tuple[str, Callable[[str], str]]] = {
+    'nhs.uk': ("https://www.nhs.uk/", lambda topic: f"https://www.nhs.uk/conditions/{_slug(topic)}/"),
+    'mayo clinic': (
+        "https://www.mayoclinic.org/",
+        lambda topic: f"https://www.mayoclinic.org/diseases-conditions/{_slug(topic)}/symptoms-causes/syc-20354349",
+    ),
+    'cdc': ("https://www.cdc.gov/", lambda topic: "https://www.cdc.gov/"),
+    'webmd': ("https://www.webmd.com/", lambda topic: f"https://www.webmd.com/a-to-z-guides/{_slug(topic)}"),
+    'medlineplus': (
+        "https://medlineplus.gov/",
+        lambda topic: f"https://medlineplus.gov/{topic.lower().translate(_COMPACT_SLUG_TRANS)}.html",
+    ),
+    'cancer research': _CANCER_RESEARCH_UK,
+    'cancerresearchuk': _CANCER_RESEARCH_UK,
+}
+
 def convert_text_source_to_link(source_text: str) -> str:
     """
     Convert text-based sources like 'NHS.uk - Leptospirosis' to clickable markdown links
     """
     source_lower = source_text.lower()
-    
-    # NHS sources
-    if 'nhs.uk' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            # Convert topic to URL-friendly format
-            topic_slug = topic.lower().replace(' ', '-').replace(',', '').replace('(', '').replace(')', '')
-            nhs_url = f"https://www.nhs.uk/conditions/{topic_slug}/"
-            return f"[{source_text}]({nhs_url})"
-        else:
-            return f"[{source_text}](https://www.nhs.uk/)"
-    
-    # Mayo Clinic sources
-    elif 'mayo clinic' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            # Convert topic to URL-friendly format
-            topic_slug = topic.lower().replace(' ', '-').replace(',', '').replace('(', '').replace(')', '')
-            mayo_url = f"https://www.mayoclinic.org/diseases-conditions/{topic_slug}/symptoms-causes/syc-20354349"
-            return f"[{source_text}]({mayo_url})"
-        else:
-            return f"[{source_text}](https://www.mayoclinic.org/)"
-    
-    # CDC sources
-    elif 'cdc' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            # Convert topic to URL-friendly format
-            topic_slug = topic.lower().replace(' ', '-').replace(',', '').replace('(', '').replace(')', '')
-            cdc_url = f"https://www.cdc.gov/"
-            return f"[{source_text}]({cdc_url})"
-        else:
-            return f"[{source_text}](https://www.cdc.gov/)"
-    
-    # WebMD sources
-    elif 'webmd' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            topic_slug = topic.lower().replace(' ', '-').replace(',', '').replace('(', '').replace(')', '')
-            webmd_url = f"https://www.webmd.com/a-to-z-guides/{topic_slug}"
-            return f"[{source_text}]({webmd_url})"
-        else:
-            return f"[{source_text}](https://www.webmd.com/)"
-    
-    # MedlinePlus sources
-    elif 'medlineplus' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            topic_slug = topic.lower().replace(' ', '').replace(',', '').replace('(', '').replace(')', '')
-            medline_url = f"https://medlineplus.gov/{topic_slug}.html"
-            return f"[{source_text}]({medline_url})"
-        else:
-            return f"[{source_text}](https://medlineplus.gov/)"
-    
-    # Cancer Research UK sources
-    elif 'cancer research' in source_lower or 'cancerresearchuk' in source_lower:
-        if '-' in source_text:
-            parts = source_text.split('-', 1)
-            topic = parts[1].strip() if len(parts) > 1 else ''
-            topic_slug = topic.lower().replace(' ', '-').replace(',', '').replace('(', '').replace(')', '')
-            cruk_url = f"https://www.cancerresearchuk.org/about-cancer/{topic_slug}"
-            return f"[{source_text}]({cruk_url})"
-        else:
-            return f"[{source_text}](https://www.cancerresearchuk.org/)"
+    for marker, (home_url, topic_url) in SOURCE_LINKS.items():
+        if marker in source_lower:
+            if '-' in source_text:
+                topic = source_text.split('-', 1)[1].strip()
+                return f"[{source_text}]({topic_url(topic)})"
+            return f"[{source_text}]({home_url})"
     
     # If no pattern matches, return original text
     return source_text
 
 # --------------------------------------------------------------------------- #
-# Main answer function
+# Answer and retrieval caches
 # --------------------------------------------------------------------------- #
-def answer(
-    query: str, 
-    conversation_history: Optional[List[Dict[str, str]]] = None,
-    original_query: Optional[str] = None,
-    user_context: Optional[str] = None,
-) -> Tuple[str, List[str], Dict[str, Any]]:
+FALLBACK_RESPONSE = "I'm having trouble responding right now. Please try again in a moment."
+
+def _quantize(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Symmetric int8 quantization of a vector; returns (int8 vector, dequantization factor)."""
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return np.round(vector / scale).astype(np.int8), scale
+
+class _SemanticCache:
     """
-    Main answer function that handles both general and medical questions.
+    Two-tier cache keyed by question: exact match on the normalized question,
+    then nearest cached question embedding above a cosine threshold.
     
-    Args:
-        query: Current user question (may include context)
-        conversation_history: List of {"role": "user/assistant", "content": "..."}
-        original_query: Original query without conversation context
-    
-    Returns:
-        (response_text, sources, metadata)
+    Embeddings live in one preallocated int8 matrix (each row scaled by its own
+    max magnitude, a quarter of the float32 size), so a semantic lookup is a
+    single int32-accumulated matrix-vector product over all cached questions.
     """
-    
-    print(f"[DEBUG] === ANSWER FUNCTION CALLED ===")
-    print(f"[DEBUG] Query: {query[:200]}...")
-    print(f"[DEBUG] Original query: {original_query}")
-    print(f"[DEBUG] Conversation history length: {len(conversation_history) if conversation_history else 0}")
-    
-    if conversation_history:
-        print(f"[DEBUG] Conversation history:")
-        for i, msg in enumerate(conversation_history):
-            print(f"  {i+1}. {msg['role']}: {msg['content'][:100]}...")
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 12 * 3600, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        # key -> (matrix row or -1, stored_at, result), oldest first
+        self._entries: OrderedDict[str, Tuple[int, float, Any]] = OrderedDict()
+        self._row_keys: List[Optional[str]] = [None] * maxsize
+        self._free_rows = list(range(maxsize))
+        self._vectors: Optional[np.ndarray] = None  # (maxsize, dim) int8
+        self._scales = np.zeros(maxsize, dtype=np.float32)  # Dequantization factor per row; 0 for free rows
+
+    def get(self, key: str, vector: Optional[np.ndarray] = None) -> Any:
+        if key not in self._entries and vector is not None and self._vectors is not None:
+            quantized, scale = _quantize(vector)
+            dots = np.einsum("ij,j->i", self._vectors, quantized, dtype=np.int32, casting="unsafe")
+            similarities = dots * self._scales * scale
+            row = int(similarities.argmax())
+            if similarities[row] >= self.threshold:
+                key = self._row_keys[row]
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def put(self, key: str, vector: Optional[np.ndarray], result: Any) -> None:
+        if key in self._entries:
+            self._evict(key)
+        elif len(self._entries) >= self.maxsize:
+            self._evict(next(iter(self._entries)))
+        row = -1
+        if vector is not None:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.int8)
+            row = self._free_rows.pop()
+            self._vectors[row], self._scales[row] = _quantize(vector)
+            self._row_keys[row] = key
+        self._entries[key] = (row, time.monotonic(), result)
+
+    def _evict(self, key: str) -> None:
+        row = self._entries.pop(key)[0]
+        if row >= 0:
+            self._scales[row] = 0
+            self._row_keys[row] = None
+            self._free_rows.append(row)
+
+# answer() results for context-free questions
+_answer_cache = _SemanticCache()
+# Retrieval results for context-free questions, which still pays off when the
+# answer itself can't be cached (e.g. it's tailored with user context). Filled
+# from live traffic, so the most frequently asked questions stay resident.
+_retrieval_cache = _SemanticCache(maxsize=4096, threshold=0.92)
+
+def _normalize_query(query: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+# --------------------------------------------------------------------------- #
+# Main answer function
+# --------------------------------------------------------------------------- #
+@dataclass
+class _PreparedAnswer:
+    """Everything needed to generate and finish an answer, or a cached result to return as is."""
+    cached: Optional[Tuple[str, List[str], Dict[str, Any]]] = None
+    current_message: str = ""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    is_medical: bool = False
+    rag_context: Optional[str] = None
+    rag_score: float = 0.0
+    sources: List[str] = field(default_factory=list)
+    user_context: Optional[str] = None
+    cache_key: Optional[str] = None
+    query_embedding: Optional[np.ndarray] = None
+
+async def _prepare_answer(
+    query: str, 
+    conversation_history: Optional[List[Dict[str, str]]],
+    original_query: Optional[str],
+    user_context: Optional[str],
+) -> _PreparedAnswer:
+    """Cache lookup, classification and retrieval: everything before GPT-4o is called."""
+    logger.debug(
+        "answer() called with query %.200r, original query %r, %d history messages",
+        query, original_query, len(conversation_history or []),
+    )
     
     # Use original query for classification if available, otherwise use full query
     classify_query = original_query if original_query else query
     current_message = original_query if original_query else query
     
+    # Only context-free questions are cached: answers to follow-ups, or tailored
+    # to one user's health background, must never be served to anyone else
+    cache_key = None
+    if not conversation_history and not user_context:
+        cache_key = hashlib.sha256(_normalize_query(current_message).encode()).hexdigest()
+        cached = _answer_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Answer cache hit")
+            return _PreparedAnswer(cached=cached)
+    
+    # One embeddings call serves the semantic cache, the classifier and both
+    # retrieval queries (classify_query and current_message are the same text)
+    embeddings = query_embedding = None
+    contextual_query = _contextual_query(current_message, conversation_history)
+    try:
+        texts = [current_message] if contextual_query is None else [current_message, contextual_query]
+        embeddings = await asyncio.to_thread(_embed, texts)
+        query_embedding = embeddings[0]
+    except Exception as e:
+        logger.warning("Query embedding error: %s", e)
+    
+    if cache_key is not None:
+        if query_embedding is not None:
+            cached = _answer_cache.get(cache_key, query_embedding)
+            if cached is not None:
+                logger.debug("Answer cache hit")
+                return _PreparedAnswer(cached=cached)
+        logger.debug("Answer cache miss")
+    
+    # Speculatively start retrieval alongside classification so medical questions
+    # don't pay for the two round trips back to back; discarded for general chat
+    rag_task = None
+    if settings.speculative_rag:
+        rag_task = asyncio.create_task(
+            get_rag_context_weighted_async(current_message, conversation_history, embeddings=embeddings)
+        )
+        # Mark a failure as retrieved even if the result is never awaited
+        rag_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
     # Determine if this is a medical question
-    is_medical = is_medical_question(classify_query)
-    print(f"[DEBUG] Question classified as: {'MEDICAL' if is_medical else 'GENERAL'}")
-    print(f"[DEBUG] Classify query: {classify_query}")
+    is_medical = await asyncio.to_thread(is_medical_question, classify_query, query_embedding)
+    logger.debug("Question classified as %s: %r", "MEDICAL" if is_medical else "GENERAL", classify_query)
     
     # Prepare conversation messages (don't include current message yet)
     messages = conversation_history or []
-    print(f"[DEBUG] Messages to send to GPT-4o: {len(messages)} history messages")
     
     rag_context = None
     sources = []
@@ -554,54 +857,133 @@ def answer(
     
     # For medical questions, try to get RAG context
     if is_medical:
-        print(f"[DEBUG] Getting RAG context for medical question...")
+        logger.debug("Getting RAG context for medical question")
         try:
             # Use weighted RAG search - prioritize current question over context
-            rag_context, rag_score, sources = get_rag_context_weighted(
+            rag_context, rag_score, sources = await (rag_task or get_rag_context_weighted_async(
                 current_message, 
-                conversation_history
-            )
+                conversation_history,
+                embeddings=embeddings
+            ))
             if rag_context:
-                print(f"[DEBUG] Using RAG context (weighted score: {rag_score:.3f})")
-                print(f"[DEBUG] RAG context preview: {rag_context[:200]}...")
-                print(f"[DEBUG] Sources: {sources}")
+                logger.debug("Using RAG context (weighted score: %.3f), sources: %s", rag_score, sources)
             else:
-                print(f"[DEBUG] No suitable RAG context found (weighted score: {rag_score:.3f})")
+                logger.debug("No suitable RAG context found (weighted score: %.3f)", rag_score)
         except Exception as e:
-            print(f"[DEBUG] RAG context error: {e}")
+            logger.warning("RAG context error: %s", e)
             # Continue without RAG context
     else:
-        print(f"[DEBUG] Skipping RAG for general conversation")
-    
-    print(f"[DEBUG] Calling GPT-4o with {len(messages)} conversation messages")
-    
-    # Generate response with GPT-4o (with or without RAG enhancement)
-    response = generate_response_with_gpt4o(messages, current_message, rag_context, sources, is_medical, user_context)
-    
-    print(f"[DEBUG] GPT-4o response: {response[:200]}...")
+        logger.debug("Skipping RAG for general conversation")
+        if rag_task:
+            rag_task.cancel()
+    
+    logger.debug("Calling GPT-4o with %d conversation messages", len(messages))
+    return _PreparedAnswer(
+        current_message=current_message,
+        messages=messages,
+        is_medical=is_medical,
+        rag_context=rag_context,
+        rag_score=rag_score,
+        sources=sources,
+        user_context=user_context,
+        cache_key=cache_key,
+        query_embedding=query_embedding,
+    )
+
+def _finish_answer(prepared: _PreparedAnswer, response: str) -> Tuple[str, List[str], Dict[str, Any]]:
+    """Format GPT-4o's response with its sources, build the metadata and cache the result."""
+    logger.debug("GPT-4o response: %.200r", response)
     
     # Format response with appropriate sources
-    formatted_response, final_sources = format_response_with_sources(response, sources, {
-        "is_medical": is_medical,
-        "used_rag": rag_context is not None,
-        "rag_score": rag_score,
+    formatted_response, final_sources = format_response_with_sources(response, prepared.sources, {
+        "is_medical": prepared.is_medical,
+        "used_rag": prepared.rag_context is not None,
+        "rag_score": prepared.rag_score,
         "model_used": "gpt-4o",
-        "conversation_length": len(messages)
+        "conversation_length": len(prepared.messages)
     })
     
     # Metadata for debugging/analytics
     metadata = {
-        "is_medical": is_medical,
-        "used_rag": rag_context is not None,
-        "rag_score": rag_score,
+        "is_medical": prepared.is_medical,
+        "used_rag": prepared.rag_context is not None,
+        "rag_score": prepared.rag_score,
         "model_used": "gpt-4o",
-        "conversation_length": len(messages),
+        "conversation_length": len(prepared.messages),
         "sources_count": len(final_sources)
     }
     
-    print(f"[DEBUG] Final metadata: {metadata}")
+    logger.debug("Final metadata: %s", metadata)
+    
+    result = (formatted_response, final_sources, metadata)
+    if prepared.cache_key and response != FALLBACK_RESPONSE:
+        _answer_cache.put(prepared.cache_key, prepared.query_embedding, result)
+    return result
+
+async def answer(
+    query: str, 
+    conversation_history: Optional[List[Dict[str, str]]] = None,
+    original_query: Optional[str] = None,
+    user_context: Optional[str] = None,
+) -> Tuple[str, List[str], Dict[str, Any]]:
+    """
+    Main answer function that handles both general and medical questions.
+    
+    Args:
+        query: Current user question (may include context)
+        conversation_history: List of {"role": "user/assistant", "content": "..."}
+        original_query: Original query without conversation context
     
-    return formatted_response, final_sources, metadata
+    Returns:
+        (response_text, sources, metadata)
+    """
+    prepared = await _prepare_answer(query, conversation_history, original_query, user_context)
+    if prepared.cached is not None:
+        return prepared.cached
+    
+    # Generate response with GPT-4o (with or without RAG enhancement)
+    response = await asyncio.to_thread(
+        generate_response_with_gpt4o,
+        prepared.messages, prepared.current_message, prepared.rag_context,
+        prepared.sources, prepared.is_medical, prepared.user_context,
+    )
+    return _finish_answer(prepared, response)
+
+class AnswerStream:
+    """
+    Streaming counterpart of answer(): iterating yields the raw response text as
+    GPT-4o generates it. Once exhausted, `result` holds what answer() would have
+    returned; its text has sources formatted in, so it supersedes the streamed text.
+    
+    Takes the same arguments as answer().
+    """
+
+    def __init__(
+        self,
+        query: str, 
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        original_query: Optional[str] = None,
+        user_context: Optional[str] = None,
+    ):
+        self._args = (query, conversation_history, original_query, user_context)
+        self.result: Optional[Tuple[str, List[str], Dict[str, Any]]] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        prepared = await _prepare_answer(*self._args)
+        if prepared.cached is not None:
+            self.result = prepared.cached
+            yield prepared.cached[0]
+            return
+        
+        chunks = []
+        async for chunk in stream_response_with_gpt4o(
+            prepared.messages, prepared.current_message, prepared.rag_context,
+            prepared.is_medical, prepared.user_context,
+        ):
+            chunks.append(chunk)
+            yield chunk
+        self.result = _finish_answer(prepared, "".join(chunks))
+
 
 # --------------------------------------------------------------------------- #
 # Backward compatibility function
@@ -613,7 +995,7 @@ def answer_legacy(query: str) -> Tuple[Optional[str], float, List[str]]:
     
     NOTE: This is deprecated. New code should use answer() function.
     """
-    response, sources, metadata = answer(query)
+    response, sources, metadata = asyncio.run(answer(query))
     
     # For legacy compatibility, never return None (always have GPT-4o fallback)
     # But we'll simulate the old behavior for any calling code that expects it
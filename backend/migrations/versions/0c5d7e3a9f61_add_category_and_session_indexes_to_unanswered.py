@@ -0,0 +1,36 @@
+"""add category and session indexes to unanswered queries
+
+Revision ID: 0c5d7e3a9f61
+Revises: f0a3c6d92b14
+Create Date: 2026-10-15 13:02:41.336907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0c5d7e3a9f61'
+down_revision: Union[str, Sequence[str], None] = 'f0a3c6d92b14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY avoids locking out writes while the indexes build, but cannot
+    # run inside a transaction (ignored outside Postgres)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_unanswered_category_created', 'unanswered_queries', ['category', 'created_at'],
+                        unique=False, postgresql_concurrently=True)
+        op.create_index('ix_unanswered_session', 'unanswered_queries', ['session_id'],
+                        unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_unanswered_session', table_name='unanswered_queries', postgresql_concurrently=True)
+        op.drop_index('ix_unanswered_category_created', table_name='unanswered_queries', postgresql_concurrently=True)
@@ -15,8 +15,16 @@ down_revision: Union[str, Sequence[str], None] = 'fix_add_confidence_score_to_me
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
+def _has_session_id() -> bool:
+    columns = sa.inspect(op.get_bind()).get_columns('unanswered_queries')
+    return any(column['name'] == 'session_id' for column in columns)
+
 def upgrade() -> None:
-    op.add_column('unanswered_queries', sa.Column('session_id', sa.Integer(), nullable=True))
+    # Databases migrated while auto_add_session_id_to_unanswered_queries still
+    # added the column already have it
+    if not _has_session_id():
+        op.add_column('unanswered_queries', sa.Column('session_id', sa.Integer(), nullable=True))
 
 def downgrade() -> None:
-    op.drop_column('unanswered_queries', 'session_id')
+    if _has_session_id():
+        op.drop_column('unanswered_queries', 'session_id')
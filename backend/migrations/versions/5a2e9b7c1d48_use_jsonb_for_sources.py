@@ -0,0 +1,40 @@
+"""use jsonb for sources
+
+Revision ID: 5a2e9b7c1d48
+Revises: 0c5d7e3a9f61
+Create Date: 2026-10-15 13:27:55.901264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a2e9b7c1d48'
+down_revision: Union[str, Sequence[str], None] = '0c5d7e3a9f61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('messages', 'unanswered_queries')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # jsonb only exists on Postgres; other backends keep JSON
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.alter_column(table, 'sources', type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                        existing_nullable=True, postgresql_using='sources::jsonb')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.alter_column(table, 'sources', type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                        existing_nullable=True, postgresql_using='sources::json')
@@ -0,0 +1,30 @@
+"""add session indexes to messages
+
+Revision ID: 7b1fd78ba4c8
+Revises: a15a9fdff269
+Create Date: 2026-10-15 09:12:44.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1fd78ba4c8'
+down_revision: Union[str, Sequence[str], None] = 'a15a9fdff269'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_session_created', 'messages', ['session_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_session_role_created', 'messages', ['session_id', 'role', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_session_role_created', table_name='messages')
+    op.drop_index('ix_messages_session_created', table_name='messages')
@@ -15,8 +15,10 @@ down_revision: Union[str, Sequence[str], None] = 'fix_add_confidence_score_to_me
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
+# Duplicate of 544d534a09ba, which owns the column; kept as a no-op so the
+# 8dc1fda384cd merge and databases stamped with this revision stay valid.
 def upgrade() -> None:
-    op.add_column('unanswered_queries', sa.Column('session_id', sa.Integer(), nullable=True))
+    pass
 
 def downgrade() -> None:
-    op.drop_column('unanswered_queries', 'session_id') 
\ No newline at end of file
+    pass 
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""add full text search indexes
+
+Revision ID: b8d14e6f0a27
+Revises: 5a2e9b7c1d48
+Create Date: 2026-10-15 13:58:12.640375
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d14e6f0a27'
+down_revision: Union[str, Sequence[str], None] = '5a2e9b7c1d48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Expression indexes must match models.search_vector() exactly; Postgres only
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_search ON messages USING gin "
+            "(to_tsvector('english', (coalesce(content, '') || ' ') || coalesce(user_question, '')))"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_unanswered_queries_search ON unanswered_queries USING gin "
+            "(to_tsvector('english', coalesce(text, '')))"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_unanswered_queries_search")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_search")
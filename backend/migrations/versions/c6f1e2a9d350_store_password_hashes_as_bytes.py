@@ -0,0 +1,43 @@
+"""store password hashes as bytes
+
+Revision ID: c6f1e2a9d350
+Revises: b8d14e6f0a27
+Create Date: 2026-10-15 14:41:05.228914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f1e2a9d350'
+down_revision: Union[str, Sequence[str], None] = 'b8d14e6f0a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # bcrypt hashes are ASCII, so the UTF-8 bytes are the hash itself
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'hashed_pw', type_=sa.LargeBinary(), existing_type=sa.String(length=255),
+                        existing_nullable=False, postgresql_using="convert_to(hashed_pw, 'UTF8')")
+        return
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('hashed_pw', type_=sa.LargeBinary(), existing_type=sa.String(length=255),
+                              existing_nullable=False)
+    op.execute("UPDATE users SET hashed_pw = CAST(hashed_pw AS BLOB)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('users', 'hashed_pw', type_=sa.String(length=255), existing_type=sa.LargeBinary(),
+                        existing_nullable=False, postgresql_using="convert_from(hashed_pw, 'UTF8')")
+        return
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.alter_column('hashed_pw', type_=sa.String(length=255), existing_type=sa.LargeBinary(),
+                              existing_nullable=False)
+    op.execute("UPDATE users SET hashed_pw = CAST(hashed_pw AS TEXT)")
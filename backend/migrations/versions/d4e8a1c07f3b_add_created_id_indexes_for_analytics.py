@@ -0,0 +1,30 @@
+"""add created_id indexes for analytics
+
+Revision ID: d4e8a1c07f3b
+Revises: 7b1fd78ba4c8
+Create Date: 2026-10-15 10:03:17.204816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e8a1c07f3b'
+down_revision: Union[str, Sequence[str], None] = '7b1fd78ba4c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_created_id', 'messages', ['created_at', 'id'], unique=False)
+    op.create_index('ix_unanswered_queries_created_id', 'unanswered_queries', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_unanswered_queries_created_id', table_name='unanswered_queries')
+    op.drop_index('ix_messages_created_id', table_name='messages')
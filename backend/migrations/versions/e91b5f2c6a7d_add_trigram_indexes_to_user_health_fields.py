@@ -0,0 +1,38 @@
+"""add trigram indexes to user health fields
+
+Revision ID: e91b5f2c6a7d
+Revises: d4e8a1c07f3b
+Create Date: 2026-10-15 10:41:52.873310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e91b5f2c6a7d'
+down_revision: Union[str, Sequence[str], None] = 'd4e8a1c07f3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # GIN trigram indexes are Postgres-only; SQLite dev databases keep scanning
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_users_long_term_conditions_trgm', 'users', ['long_term_conditions'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'long_term_conditions': 'gin_trgm_ops'})
+    op.create_index('ix_users_medications_trgm', 'users', ['medications'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'medications': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_users_medications_trgm', table_name='users')
+    op.drop_index('ix_users_long_term_conditions_trgm', table_name='users')
@@ -0,0 +1,52 @@
+"""cascade message deletes from sessions
+
+Revision ID: f0a3c6d92b14
+Revises: e91b5f2c6a7d
+Create Date: 2026-10-15 11:26:08.519442
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f0a3c6d92b14'
+down_revision: Union[str, Sequence[str], None] = 'e91b5f2c6a7d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Foreign keys on SQLite are unnamed; batch mode names them with this convention
+# so they can be dropped. Postgres names them the same way by default.
+NAMING = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def _replace_session_fk(table: str, ondelete) -> None:
+    existing = [
+        fk for fk in sa.inspect(op.get_bind()).get_foreign_keys(table)
+        if fk['constrained_columns'] == ['session_id']
+    ]
+    with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+        if existing:
+            batch_op.drop_constraint(f'{table}_session_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key(f'{table}_session_id_fkey', 'chat_sessions', ['session_id'], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _replace_session_fk('messages', 'CASCADE')
+    # unanswered_queries.session_id was added without a foreign key; clear
+    # references to sessions that were already deleted before adding one
+    op.execute(
+        'UPDATE unanswered_queries SET session_id = NULL '
+        'WHERE session_id IS NOT NULL AND session_id NOT IN (SELECT id FROM chat_sessions)'
+    )
+    _replace_session_fk('unanswered_queries', 'SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('unanswered_queries', naming_convention=NAMING) as batch_op:
+        batch_op.drop_constraint('unanswered_queries_session_id_fkey', type_='foreignkey')
+    _replace_session_fk('messages', None)
@@ -0,0 +1,494 @@
+"""
+Shared crawl-and-embed pipeline for the Cancer Research UK indexers.
+advanced_cancer_indexer.py and build_cancer_research_index.py only differ in
+configuration; both call build_index() with their own settings.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import List, Set, Optional, Dict, Any, Pattern
+from urllib.parse import urljoin, urlparse
+from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+from chromadb import PersistentClient
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.embeddings.openai import OpenAIEmbedding
+from dotenv import load_dotenv
+import openai
+
+load_dotenv(override=True)
+
+# -------- paths --------
+ROOT = pathlib.Path(__file__).parent
+PERSIST_DIR = ROOT / "chroma_db"
+RAW_HTML_DIR = ROOT / "html"
+RAW_HTML_DIR.mkdir(exist_ok=True)
+
+# -------- sanity checks --------
+key = os.getenv("OPENAI_API_KEY")
+if not key:
+    sys.exit("❌  OPENAI_API_KEY is NOT set – export it or put it in .env first.")
+openai.api_key = key
+print("✅  Using OPENAI_API_KEY =", key[:10], "...")
+
+# -------- configuration --------
+BASE_URL = "https://www.cancerresearchuk.org"
+DOMAIN = "cancerresearchuk.org"
+COLLECTION_NAME = "cancer_research_docs"
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+TIMEOUT = 30
+MAX_WORKERS = 8  # concurrent page downloads
+MAX_REQUEST_DELAY = 30  # ceiling for the request interval when the server pushes back
+INSERT_BATCH_SIZE = 250  # chunks embedded and added to Chroma per batch
+EMBED_BATCH_SIZE = 256  # texts per OpenAI embeddings request
+
+# One session shared by every request so fetches reuse pooled keep-alive
+# connections. Connection errors and 5xx responses are retried here; 429 and
+# 503 are left to fetch_with_retry so the rate limiter can slow down.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 504)),
+))
+
+# Unwanted page chrome, and where to look for the main content (first match wins)
+STRIP_XPATH = "//nav|//footer|//aside|//script|//style|//header|//form"
+MAIN_CONTENT_XPATHS = [
+    "//main",
+    '//*[@role="main"]',
+    '//*[contains(concat(" ", normalize-space(@class), " "), " main-content ")]',
+    '//*[@id="main-content"]',
+    '//*[contains(concat(" ", normalize-space(@class), " "), " content ")]',
+]
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+def keyword_pattern(words: List[str]) -> Optional[Pattern[str]]:
+    """One case-insensitive alternation, so each string is scanned once instead of once per word."""
+    if not words:
+        return None
+    return re.compile("|".join(map(re.escape, words)), re.IGNORECASE)
+
+def is_cancer_related(url: str, title: str = "", content: str = "", *,
+                      keyword_re: Pattern[str], category_re: Optional[Pattern[str]] = None) -> bool:
+    """Check if a URL or content is cancer-related."""
+    # URL categories first, then keywords anywhere
+    return bool(
+        (category_re is not None and category_re.search(url))
+        or keyword_re.search(url)
+        or keyword_re.search(title)
+        or keyword_re.search(content)
+    )
+
+def extract_urls_from_html_sitemap(sitemap_url: str) -> Set[str]:
+    """Extract URLs from HTML sitemap."""
+    print(f"🔍 Extracting URLs from HTML sitemap: {sitemap_url}")
+
+    try:
+        response = SESSION.get(sitemap_url, timeout=TIMEOUT)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.content, 'lxml')
+
+        urls = set()
+
+        # Find all links in the sitemap
+        for link in soup.find_all('a', href=True):
+            href = link.get('href')
+            if href:
+                # Convert relative URLs to absolute
+                if href.startswith('/'):
+                    full_url = urljoin(BASE_URL, href)
+                elif href.startswith('http'):
+                    full_url = href
+                else:
+                    continue
+
+                # Only include Cancer Research UK URLs
+                if DOMAIN in full_url:
+                    urls.add(full_url)
+
+        print(f"📊 Found {len(urls)} URLs in HTML sitemap")
+        return urls
+
+    except Exception as e:
+        print(f"❌ Error extracting URLs from HTML sitemap: {e}")
+        return set()
+
+def discover_sitemaps() -> List[str]:
+    """Find the sitemaps advertised by robots.txt."""
+    robots_url = urljoin(BASE_URL, "/robots.txt")
+    print(f"🔍 Looking for sitemaps in {robots_url}")
+
+    try:
+        response = SESSION.get(robots_url, timeout=TIMEOUT)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"⚠️  Could not read robots.txt: {e}")
+        return []
+
+    sitemaps = [
+        line.split(":", 1)[1].strip()
+        for line in response.text.splitlines()
+        if line.strip().lower().startswith("sitemap:")
+    ]
+    print(f"📊 Found {len(sitemaps)} sitemaps in robots.txt")
+    return sitemaps
+
+def extract_urls_from_xml_sitemap(sitemap_url: str) -> Set[str]:
+    """Extract URLs from XML sitemap, following sitemap indexes."""
+    print(f"🔍 Extracting URLs from XML sitemap: {sitemap_url}")
+
+    try:
+        response = SESSION.get(sitemap_url, timeout=TIMEOUT, stream=True)
+        response.raise_for_status()
+        response.raw.decode_content = True  # undo any gzip transfer encoding
+
+        urls = set()
+        child_sitemaps = []
+
+        # Stream-parse <url> entries, and the <sitemap> entries of a sitemap
+        # index (standard namespaced format or plain tags), dropping each one
+        # once read so memory stays flat however big the sitemap is
+        tags = (f'{{{SITEMAP_NS}}}url', 'url', f'{{{SITEMAP_NS}}}sitemap', 'sitemap')
+        for _, elem in etree.iterparse(response.raw, events=('end',), tag=tags):
+            loc = elem.findtext(f'{{{SITEMAP_NS}}}loc') or elem.findtext('loc')
+            if loc:
+                if etree.QName(elem).localname == 'sitemap':
+                    child_sitemaps.append(loc.strip())
+                elif DOMAIN in loc:
+                    urls.add(loc.strip())
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+        print(f"📊 Found {len(urls)} URLs in XML sitemap")
+
+        # A sitemap index only lists other sitemaps - fetch those concurrently
+        if child_sitemaps:
+            print(f"📂 Sitemap index lists {len(child_sitemaps)} sitemaps")
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+                for child_urls in pool.map(extract_urls_from_xml_sitemap, child_sitemaps):
+                    urls.update(child_urls)
+
+        return urls
+
+    except Exception as e:
+        print(f"❌ Error extracting URLs from XML sitemap: {e}")
+        return set()
+
+def extract_all_urls(sitemap_urls: List[str]) -> Set[str]:
+    """Extract URLs from all available sitemaps."""
+    all_urls = set()
+
+    # Prefer the XML sitemaps robots.txt points at; they're far cheaper to
+    # parse than the HTML sitemap page
+    xml_sitemaps = discover_sitemaps() or [u for u in sitemap_urls if u.endswith('.xml')]
+    for sitemap_url in xml_sitemaps:
+        all_urls.update(extract_urls_from_xml_sitemap(sitemap_url))
+
+    # Only scrape the HTML sitemap if no XML sitemap gave us anything
+    if not all_urls:
+        for sitemap_url in sitemap_urls:
+            if not sitemap_url.endswith('.xml'):
+                all_urls.update(extract_urls_from_html_sitemap(sitemap_url))
+
+    print(f"📊 Total unique URLs found: {len(all_urls)}")
+    return all_urls
+
+class RateLimiter:
+    """Spaces requests out across all workers, adapting to how the server responds.
+
+    Starts at the interval the fixed per-worker delay used to give, doubles it
+    on 429/503 and eases it back down to that floor as requests succeed.
+    """
+
+    def __init__(self, interval: float, max_interval: float):
+        self.min_interval = interval
+        self.max_interval = max_interval
+        self.interval = interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        time.sleep(slot - now)
+
+    def success(self):
+        with self._lock:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+
+    def throttled(self):
+        with self._lock:
+            self.interval = min(self.max_interval, self.interval * 2)
+
+def cached_html_path(url: str) -> pathlib.Path:
+    """Fixed-length cache file for a URL, sharded into 256 subdirectories."""
+    digest = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return RAW_HTML_DIR / digest[:2] / f"{digest[2:]}.html"
+
+def fetch_with_retry(url: str, limiter: RateLimiter, retry_delay: float,
+                     max_retries: int = 3) -> Optional[bytes]:
+    """Fetch a URL with retry logic, save it to file and return the raw HTML.
+
+    Cached pages saved with an ETag or Last-Modified header are revalidated
+    with a conditional GET, so a 304 reuses the cached copy.
+    """
+    fname = cached_html_path(url)
+    validators_file = fname.with_suffix(".json")
+    headers = {}
+
+    if fname.exists():
+        validators = json.loads(validators_file.read_text()) if validators_file.exists() else {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        if not headers:
+            print(f"📁 Using cached: {url}")
+            return fname.read_bytes()
+    else:
+        # Pages cached under the old URL-derived names (those never exceeded NAME_MAX)
+        legacy = RAW_HTML_DIR / (re.sub(r"[^a-z0-9]+", "_", url.lower().split("//")[1]) + ".html")
+        if len(legacy.name) <= 255 and legacy.exists():
+            print(f"📁 Using cached: {url}")
+            return legacy.read_bytes()
+
+    for attempt in range(max_retries):
+        try:
+            # Wait for a request slot to be respectful to the server
+            limiter.wait()
+            print(f"⇢ Downloading ({attempt + 1}/{max_retries}): {url}")
+            response = SESSION.get(url, timeout=TIMEOUT, headers=headers)
+            if response.status_code in (429, 503):
+                limiter.throttled()
+            response.raise_for_status()
+            limiter.success()
+
+            if response.status_code == 304:
+                print(f"📁 Not modified, using cached: {url}")
+                return fname.read_bytes()
+
+            # Save the HTML content as received, plus what's needed to revalidate it
+            fname.parent.mkdir(exist_ok=True)
+            fname.write_bytes(response.content)
+            validators = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            if validators["etag"] or validators["last_modified"]:
+                validators_file.write_text(json.dumps(validators))
+
+            return response.content
+
+        except Exception as e:
+            print(f"⚠️  Attempt {attempt + 1} failed for {url}: {e}")
+            if attempt == max_retries - 1:
+                if fname.exists():
+                    print(f"📁 Revalidation failed, using cached: {url}")
+                    return fname.read_bytes()
+                print(f"❌ Failed to fetch {url} after {max_retries} attempts")
+                return None
+            time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+
+    return None
+
+def html_to_text(html: bytes, source: str = "") -> str:
+    """Convert HTML to clean text with enhanced processing."""
+    try:
+        tree = lxml.html.fromstring(html, parser=HTML_PARSER)
+
+        # Remove unwanted elements (drop_tree keeps the text that follows them)
+        for element in tree.xpath(STRIP_XPATH):
+            element.drop_tree()
+
+        # Get title
+        title = ""
+        title_tag = tree.find('.//title')
+        if title_tag is not None:
+            title = title_tag.text_content().strip()
+
+        # Get main content - focus on main content areas
+        text = ""
+
+        # Try to find main content areas
+        for xpath in MAIN_CONTENT_XPATHS:
+            main_elem = tree.xpath(xpath)
+            if main_elem:
+                text = " ".join(" ".join(main_elem[0].itertext()).split())
+                break
+
+        # If no main content found, use body
+        if not text:
+            body = tree.xpath('//body')
+            if body:
+                text = " ".join(" ".join(body[0].itertext()).split())
+
+        # Combine title and content
+        if title:
+            return f"Title: {title}\n\n{text}"
+        return text
+
+    except Exception as e:
+        print(f"❌ Error processing {source}: {e}")
+        return ""
+
+def filter_relevant_urls(urls: Set[str], max_pages: int, *, keyword_re: Pattern[str],
+                         category_re: Optional[Pattern[str]] = None) -> List[str]:
+    """Filter URLs to only include cancer-related content."""
+    print("🔍 Filtering URLs for cancer-related content...")
+
+    # Rank by URL path alone - no requests here. The host always contains
+    # "cancer", so only the path says anything. URLs whose path doesn't match
+    # still fill any room left under max_pages, and build_index() checks
+    # their content once the page is fetched.
+    total_urls = len(urls)
+    path_matches = {
+        url: is_cancer_related(urlparse(url).path, keyword_re=keyword_re, category_re=category_re)
+        for url in urls
+    }
+    ranked = sorted(urls, key=lambda url: (not path_matches[url], url))
+    if total_urls > max_pages:
+        print(f"⚠️  Reached maximum page limit ({max_pages})")
+    relevant_urls = ranked[:max_pages]
+
+    print(f"✅ Found {sum(path_matches.values())} relevant URLs out of {total_urls}, fetching {len(relevant_urls)}")
+    return relevant_urls
+
+def build_index(sitemap_urls: List[str], keywords: List[str], categories: List[str],
+                max_pages: int, delay: float) -> Optional[Dict[str, Any]]:
+    """Crawl the sitemaps, embed the cancer-related pages into Chroma and return run statistics."""
+    keyword_re = keyword_pattern(keywords)
+    category_re = keyword_pattern(categories)
+
+    # Extract URLs from all sitemaps
+    all_urls = extract_all_urls(sitemap_urls)
+    if not all_urls:
+        print("❌ No URLs found in sitemaps")
+        return None
+
+    # Filter for relevant content
+    relevant_urls = filter_relevant_urls(all_urls, max_pages, keyword_re=keyword_re, category_re=category_re)
+    if not relevant_urls:
+        print("❌ No relevant URLs found")
+        return None
+
+    # Fetch and process documents
+    print(f"📥 Processing {len(relevant_urls)} documents...")
+    splitter = SentenceSplitter()
+    # Chunks are kept as parallel lists that map straight onto collection.upsert();
+    # embed_texts holds what gets embedded for each chunk
+    ids, chunks, metadatas, embed_texts = [], [], [], []
+    processed = 0
+    failed_urls = []
+
+    # Download concurrently; map() keeps results in the same order as the URLs.
+    # The limiter starts at the overall rate a fixed per-worker delay would give.
+    limiter = RateLimiter(delay / MAX_WORKERS, MAX_REQUEST_DELAY)
+    fetch = partial(fetch_with_retry, limiter=limiter, retry_delay=delay)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        pages = list(pool.map(fetch, relevant_urls))
+
+    # Text extraction is CPU-bound, so spread it across processes
+    fetched = {url: page for url, page in zip(relevant_urls, pages) if page}
+    with ProcessPoolExecutor() as pool:
+        texts = dict(zip(fetched, pool.map(html_to_text, fetched.values(), fetched, chunksize=16)))
+
+    for i, url in enumerate(relevant_urls, 1):
+        print(f"📄 Processing {i}/{len(relevant_urls)}: {url}")
+
+        if url in fetched:
+            text = texts[url]
+            if text.strip() and not is_cancer_related(
+                urlparse(url).path, content=text, keyword_re=keyword_re, category_re=category_re
+            ):
+                print(f"⏭️  Skipping off-topic page: {url}")
+                continue
+            if text.strip():
+                # Extract title from URL or content
+                title = url.split('/')[-1] if url.split('/')[-1] else url
+
+                metadata = {
+                    "source": url,
+                    "title": title,
+                    "domain": DOMAIN,
+                    "category": "cancer_research"
+                }
+                # Embed each chunk under a "key: value" metadata header, as llama_index
+                # nodes did, and leave room for that header when splitting
+                metadata_str = "\n".join(f"{key}: {value}" for key, value in metadata.items())
+                for n, chunk in enumerate(splitter.split_text_metadata_aware(text, metadata_str)):
+                    ids.append(f"{url}#{n}")
+                    chunks.append(chunk)
+                    metadatas.append(metadata)
+                    embed_texts.append(f"{metadata_str}\n\n{chunk}".strip())
+                processed += 1
+            else:
+                failed_urls.append(url)
+        else:
+            failed_urls.append(url)
+
+    print(f"✅ Successfully processed {processed} documents ({len(chunks)} chunks)")
+    print(f"❌ Failed to process {len(failed_urls)} URLs")
+
+    if not chunks:
+        print("❌ No documents to embed")
+        return None
+
+    # Set up embedding model
+    embed_model = OpenAIEmbedding(
+        model="text-embedding-3-small",
+        embed_batch_size=EMBED_BATCH_SIZE,
+    )
+
+    # Set up vector store
+    client = PersistentClient(path=str(PERSIST_DIR))
+    collection = client.get_or_create_collection(COLLECTION_NAME)
+
+    # Chunk ids are derived from the URL, so a re-run replaces a page's chunks.
+    # Clear out what these pages had before in case they now split differently.
+    collection.delete(where={"source": {"$in": sorted({m["source"] for m in metadatas})}})
+
+    # Embed and upsert one batch at a time. PersistentClient writes each batch
+    # to disk as it is added, so there is no separate persist step afterwards.
+    print(f"⇢ Embedding {len(chunks)} chunks...")
+    for start in range(0, len(chunks), INSERT_BATCH_SIZE):
+        end = start + INSERT_BATCH_SIZE
+        collection.upsert(
+            ids=ids[start:end],
+            documents=chunks[start:end],
+            metadatas=metadatas[start:end],
+            embeddings=embed_model.get_text_embedding_batch(embed_texts[start:end]),
+        )
+        print(f"   {min(end, len(chunks))}/{len(chunks)} chunks")
+
+    # Verify the results
+    final_count = collection.count()
+
+    print(f"✅ Successfully embedded {final_count} documents")
+    print(f"📁 Index saved to: {PERSIST_DIR}")
+    print(f"📊 Total documents processed: {processed}")
+    print(f"📈 Success rate: {processed/len(relevant_urls)*100:.1f}%")
+
+    return {
+        "total_urls_found": len(all_urls),
+        "relevant_urls_found": len(relevant_urls),
+        "successfully_processed": processed,
+        "failed_urls": failed_urls,
+        "final_embedded_count": final_count,
+        "timestamp": time.time()
+    }
@@ -40,7 +40,7 @@ def quick_visualize():
             results = collection.get(include=['embeddings', 'metadatas', 'documents'])
             
             collections_data[collection_name] = {
-                'embeddings': np.array(results['embeddings']),
+                'embeddings': np.asarray(results['embeddings'], dtype=np.float32),
                 'metadatas': results['metadatas'],
                 'documents': results['documents'],
                 'ids': results['ids']
@@ -72,7 +72,7 @@ def quick_visualize():
     
     # Reduce to 3D using PCA
     print("🔧 Reducing dimensions with PCA...")
-    pca = PCA(n_components=3, random_state=42)
+    pca = PCA(n_components=3, svd_solver='randomized', n_oversamples=5, iterated_power=4, random_state=42)
     reduced_embeddings = pca.fit_transform(embeddings_array)
     
     # Create DataFrame
@@ -126,13 +126,13 @@ def quick_visualize():
     
     # Save the plot
     output_file = output_dir / "quick_3d_visualization.html"
-    fig.write_html(str(output_file))
+    fig.write_html(str(output_file), include_plotlyjs='cdn', include_mathjax=False)
     print(f"💾 Saved 3D visualization to: {output_file}")
     
     # Create 2D version
     print("📊 Creating 2D scatter plot...")
-    pca_2d = PCA(n_components=2, random_state=42)
-    reduced_2d = pca_2d.fit_transform(embeddings_array)
+    # The leading two components of the 3D fit are the 2D projection
+    reduced_2d = reduced_embeddings[:, :2]
     
     df_2d = pd.DataFrame({
         'x': reduced_2d[:, 0],
@@ -152,7 +152,7 @@ def quick_visualize():
     )
     
     output_file_2d = output_dir / "quick_2d_visualization.html"
-    fig_2d.write_html(str(output_file_2d))
+    fig_2d.write_html(str(output_file_2d), include_plotlyjs='cdn', include_mathjax=False)
     print(f"💾 Saved 2D visualization to: {output_file_2d}")
     
     # Print statistics
@@ -10,6 +10,7 @@ import json
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional
 import plotly.graph_objects as go
 import plotly.express as px
@@ -23,9 +24,71 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import seaborn as sns
 
+try:
+    from cuml.decomposition import PCA as cuPCA
+except ImportError:
+    cuPCA = None
+
+try:
+    from tsnecuda import TSNE as TSNE_CUDA
+except ImportError:
+    TSNE_CUDA = None
+
+try:
+    from cuml.manifold import TSNE as cuTSNE
+except ImportError:
+    cuTSNE = None
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+# Below these many points the GPU transfer/initialisation costs more than the fit
+GPU_MIN_SAMPLES = 5000
+GPU_TSNE_MIN_SAMPLES = 2000
+
+# Marker colour for each collection, in legend order
+SOURCE_COLORS = {'NHS': 'blue', 'Cancer Research UK': 'red'}
+
+# Rows fetched per collection.get() call when extracting embeddings
+GET_BATCH_SIZE = 10000
+
 # Add the parent directory to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
+def _fit_reducer(embeddings: np.ndarray, method: str, n_components: int) -> np.ndarray:
+    """Fit the requested reducer and return the projected embeddings as a NumPy array."""
+    if method.lower() == 'pca':
+        if cuPCA is not None and len(embeddings) > GPU_MIN_SAMPLES:
+            reducer = cuPCA(n_components=n_components)
+            embeddings = embeddings.astype(np.float32, copy=False)
+        else:
+            reducer = PCA(n_components=n_components, svd_solver='randomized', n_oversamples=5, iterated_power=4, random_state=42)
+    elif method.lower() == 'tsne':
+        perplexity = min(30, len(embeddings)-1)
+        # Both GPU implementations only produce 2D layouts
+        use_gpu = n_components == 2 and len(embeddings) >= GPU_TSNE_MIN_SAMPLES
+        if use_gpu and TSNE_CUDA is not None:
+            reducer = TSNE_CUDA(n_components=n_components, perplexity=perplexity, random_seed=42)
+            embeddings = embeddings.astype(np.float32, copy=False)
+        elif use_gpu and cuTSNE is not None:
+            reducer = cuTSNE(n_components=n_components, perplexity=perplexity, random_state=42)
+            embeddings = embeddings.astype(np.float32, copy=False)
+        else:
+            reducer = TSNE(n_components=n_components, random_state=42, perplexity=perplexity)
+    elif method.lower() == 'umap':
+        reducer = umap.UMAP(n_components=n_components, random_state=42)
+    else:
+        raise ValueError(f"Unknown reduction method: {method}")
+    
+    reduced_embeddings = reducer.fit_transform(embeddings)
+    if hasattr(reduced_embeddings, 'get'):
+        # cuML hands back a cupy array when it keeps the output on the GPU
+        reduced_embeddings = reduced_embeddings.get()
+    return reduced_embeddings
+
+
 class VectorVisualizer:
     """3D Vector Visualization for RAG Collections"""
     
@@ -50,6 +113,11 @@ class VectorVisualizer:
         self.nhs_data = None
         self.cancer_data = None
         self.combined_data = None
+        # Per-point plot columns (source/title/url), built once in combine_data
+        self._df = None
+        
+        # Reduced embeddings keyed by (method, n_components)
+        self._reduce_cache: Dict[tuple, np.ndarray] = {}
         
     def load_collections(self):
         """Load both NHS and Cancer Research UK collections."""
@@ -71,37 +139,52 @@ class VectorVisualizer:
             print(f"⚠️  Cancer Research UK collection not found: {e}")
             self.cancer_collection = None
     
+    def _get_collection_data(self, collection) -> Dict[str, Any]:
+        """Page through a collection, filling a preallocated float32 embedding matrix."""
+        total = collection.count()
+        embeddings = None
+        metadatas, documents, ids = [], [], []
+        
+        for offset in range(0, total, GET_BATCH_SIZE):
+            batch = collection.get(include=['embeddings', 'metadatas', 'documents'], limit=GET_BATCH_SIZE, offset=offset)
+            batch_embeddings = np.asarray(batch['embeddings'], dtype=np.float32)
+            if not len(batch_embeddings):
+                break
+            if embeddings is None:
+                embeddings = np.empty((total, batch_embeddings.shape[1]), dtype=np.float32)
+            embeddings[offset:offset + len(batch_embeddings)] = batch_embeddings
+            metadatas.extend(batch['metadatas'])
+            documents.extend(batch['documents'])
+            ids.extend(batch['ids'])
+        
+        # The collection may have shrunk between count() and the last page
+        embeddings = embeddings[:len(ids)] if embeddings is not None else np.empty((0, 0), dtype=np.float32)
+        
+        return {
+            'embeddings': embeddings,
+            'metadatas': metadatas,
+            'documents': documents,
+            'ids': ids
+        }
+    
     def extract_embeddings_and_metadata(self):
         """Extract embeddings and metadata from collections."""
         print("📊 Extracting embeddings and metadata...")
         
         # Extract NHS data
         if self.nhs_collection:
-            nhs_results = self.nhs_collection.get(include=['embeddings', 'metadatas', 'documents'])
-            self.nhs_data = {
-                'embeddings': np.array(nhs_results['embeddings']),
-                'metadatas': nhs_results['metadatas'],
-                'documents': nhs_results['documents'],
-                'ids': nhs_results['ids']
-            }
+            self.nhs_data = self._get_collection_data(self.nhs_collection)
             print(f"📈 NHS: {len(self.nhs_data['embeddings'])} embeddings extracted")
         
         # Extract Cancer Research UK data
         if self.cancer_collection:
-            cancer_results = self.cancer_collection.get(include=['embeddings', 'metadatas', 'documents'])
-            self.cancer_data = {
-                'embeddings': np.array(cancer_results['embeddings']),
-                'metadatas': cancer_results['metadatas'],
-                'documents': cancer_results['documents'],
-                'ids': cancer_results['ids']
-            }
+            self.cancer_data = self._get_collection_data(self.cancer_collection)
             print(f"📈 Cancer Research UK: {len(self.cancer_data['embeddings'])} embeddings extracted")
     
     def combine_data(self):
         """Combine data from both collections for visualization."""
         print("🔄 Combining data...")
         
-        combined_embeddings = []
         combined_metadatas = []
         combined_documents = []
         combined_ids = []
@@ -109,7 +192,6 @@ class VectorVisualizer:
         
         # Add NHS data
         if self.nhs_data:
-            combined_embeddings.extend(self.nhs_data['embeddings'])
             combined_metadatas.extend(self.nhs_data['metadatas'])
             combined_documents.extend(self.nhs_data['documents'])
             combined_ids.extend(self.nhs_data['ids'])
@@ -117,38 +199,64 @@ class VectorVisualizer:
         
         # Add Cancer Research UK data
         if self.cancer_data:
-            combined_embeddings.extend(self.cancer_data['embeddings'])
             combined_metadatas.extend(self.cancer_data['metadatas'])
             combined_documents.extend(self.cancer_data['documents'])
             combined_ids.extend(self.cancer_data['ids'])
             combined_sources.extend(['Cancer Research UK'] * len(self.cancer_data['embeddings']))
         
+        # Stack the embedding matrices directly rather than iterating their rows in Python
+        embedding_parts = [data['embeddings'] for data in (self.nhs_data, self.cancer_data) if data and len(data['embeddings'])]
+        
+        self._reduce_cache.clear()
         self.combined_data = {
-            'embeddings': np.array(combined_embeddings),
+            'embeddings': np.concatenate(embedding_parts, axis=0) if embedding_parts else np.empty((0, 0)),
             'metadatas': combined_metadatas,
             'documents': combined_documents,
             'ids': combined_ids,
-            'sources': combined_sources
+            'sources': combined_sources,
+            # Hover labels shared by every plot
+            'titles': [meta.get('title', 'Unknown') if meta else 'Unknown' for meta in combined_metadatas],
+            'urls': [meta.get('source', 'Unknown') if meta else 'Unknown' for meta in combined_metadatas]
         }
         
+        self._df = pd.DataFrame({
+            'source': pd.Categorical(combined_sources, categories=list(SOURCE_COLORS)),
+            'title': self.combined_data['titles'],
+            'url': self.combined_data['urls']
+        })
+        
         print(f"📊 Combined: {len(self.combined_data['embeddings'])} total embeddings")
     
+    def _reducer_input(self, method: str) -> np.ndarray:
+        """Return the matrix a reduction method is fitted on."""
+        embeddings = self.combined_data['embeddings']
+        
+        if method.lower() in ('tsne', 'umap') and embeddings.shape[1] > 50 and len(embeddings) > 50:
+            # Neighbour-based methods scale with the input dimension; 50 PCA
+            # components keep the structure they rely on at a fraction of the cost
+            if 'pca50' not in self.combined_data:
+                self.combined_data['pca50'] = PCA(n_components=50, svd_solver='randomized', n_oversamples=5, iterated_power=4, random_state=42).fit_transform(embeddings)
+            embeddings = self.combined_data['pca50']
+        
+        return embeddings
+    
     def reduce_dimensions(self, method: str = 'pca', n_components: int = 3):
         """Reduce high-dimensional embeddings to 3D for visualization."""
-        print(f"🔧 Reducing dimensions using {method.upper()}...")
+        key = (method.lower(), n_components)
+        if key in self._reduce_cache:
+            reduced_embeddings = self._reduce_cache[key]
+            self.combined_data['reduced_embeddings'] = reduced_embeddings
+            self.combined_data['reduction_method'] = method
+            return reduced_embeddings
         
         embeddings = self.combined_data['embeddings']
-        
-        if method.lower() == 'pca':
-            reducer = PCA(n_components=n_components, random_state=42)
-        elif method.lower() == 'tsne':
-            reducer = TSNE(n_components=n_components, random_state=42, perplexity=min(30, len(embeddings)-1))
-        elif method.lower() == 'umap':
-            reducer = umap.UMAP(n_components=n_components, random_state=42)
+        if embeddings.shape[1] == n_components:
+            # Already in the target space (e.g. precomputed projections); fitting would only perturb it
+            reduced_embeddings = embeddings.astype(np.float32, copy=False)
         else:
-            raise ValueError(f"Unknown reduction method: {method}")
-        
-        reduced_embeddings = reducer.fit_transform(embeddings)
+            print(f"🔧 Reducing dimensions using {method.upper()}...")
+            reduced_embeddings = _fit_reducer(self._reducer_input(method), method, n_components)
+        self._reduce_cache[key] = reduced_embeddings
         
         # Add reduced coordinates to combined data
         self.combined_data['reduced_embeddings'] = reduced_embeddings
@@ -164,56 +272,26 @@ class VectorVisualizer:
         # Reduce dimensions
         reduced_embeddings = self.reduce_dimensions(method)
         
-        # Create DataFrame for plotting
-        df = pd.DataFrame({
-            'x': reduced_embeddings[:, 0],
-            'y': reduced_embeddings[:, 1],
-            'z': reduced_embeddings[:, 2],
-            'source': self.combined_data['sources'],
-            'title': [meta.get('title', 'Unknown') if meta else 'Unknown' for meta in self.combined_data['metadatas']],
-            'url': [meta.get('source', 'Unknown') if meta else 'Unknown' for meta in self.combined_data['metadatas']]
-        })
+        # Add the coordinates to the shared plot columns
+        df = self._df.assign(
+            x=reduced_embeddings[:, 0],
+            y=reduced_embeddings[:, 1],
+            z=reduced_embeddings[:, 2]
+        )
         
-        # Create 3D scatter plot
-        fig = go.Figure()
-        
-        # Add NHS points
-        nhs_df = df[df['source'] == 'NHS']
-        if not nhs_df.empty:
-            fig.add_trace(go.Scatter3d(
-                x=nhs_df['x'],
-                y=nhs_df['y'],
-                z=nhs_df['z'],
-                mode='markers',
-                name='NHS',
-                marker=dict(
-                    size=4,
-                    color='blue',
-                    opacity=0.7
-                ),
-                text=nhs_df['title'],
-                hovertemplate='<b>%{text}</b><br>Source: NHS<br>URL: %{customdata}<extra></extra>',
-                customdata=nhs_df['url']
-            ))
-        
-        # Add Cancer Research UK points
-        cancer_df = df[df['source'] == 'Cancer Research UK']
-        if not cancer_df.empty:
-            fig.add_trace(go.Scatter3d(
-                x=cancer_df['x'],
-                y=cancer_df['y'],
-                z=cancer_df['z'],
-                mode='markers',
-                name='Cancer Research UK',
-                marker=dict(
-                    size=4,
-                    color='red',
-                    opacity=0.7
-                ),
-                text=cancer_df['title'],
-                hovertemplate='<b>%{text}</b><br>Source: Cancer Research UK<br>URL: %{customdata}<extra></extra>',
-                customdata=cancer_df['url']
-            ))
+        # Create 3D scatter plot, one trace per collection
+        fig = px.scatter_3d(
+            df,
+            x='x',
+            y='y',
+            z='z',
+            color='source',
+            color_discrete_map=SOURCE_COLORS,
+            category_orders={'source': list(SOURCE_COLORS)},
+            hover_name='title',
+            hover_data={'url': True, 'x': False, 'y': False, 'z': False}
+        )
+        fig.update_traces(marker=dict(size=4, opacity=0.7))
         
         # Update layout
         fig.update_layout(
@@ -229,7 +307,7 @@ class VectorVisualizer:
         
         # Save the plot
         output_file = self.output_dir / f"3d_scatter_{method}.html"
-        fig.write_html(str(output_file))
+        fig.write_html(str(output_file), include_plotlyjs='cdn', include_mathjax=False)
         print(f"💾 Saved 3D scatter plot to: {output_file}")
         
         return fig
@@ -241,14 +319,8 @@ class VectorVisualizer:
         # Reduce dimensions to 2D
         reduced_embeddings = self.reduce_dimensions(method, n_components=2)
         
-        # Create DataFrame
-        df = pd.DataFrame({
-            'x': reduced_embeddings[:, 0],
-            'y': reduced_embeddings[:, 1],
-            'source': self.combined_data['sources'],
-            'title': [meta.get('title', 'Unknown') if meta else 'Unknown' for meta in self.combined_data['metadatas']],
-            'url': [meta.get('source', 'Unknown') if meta else 'Unknown' for meta in self.combined_data['metadatas']]
-        })
+        # Add the coordinates to the shared plot columns
+        df = self._df.assign(x=reduced_embeddings[:, 0], y=reduced_embeddings[:, 1])
         
         # Create 2D scatter plot
         fig = px.scatter(
@@ -269,7 +341,7 @@ class VectorVisualizer:
         
         # Save the plot
         output_file = self.output_dir / f"2d_scatter_{method}.html"
-        fig.write_html(str(output_file))
+        fig.write_html(str(output_file), include_plotlyjs='cdn', include_mathjax=False)
         print(f"💾 Saved 2D scatter plot to: {output_file}")
         
         return fig
@@ -281,6 +353,26 @@ class VectorVisualizer:
         methods = ['pca', 'tsne', 'umap']
         figs = []
         
+        # The fits are independent, so run them in parallel up front and let the
+        # plots below pick them up from the cache. Workers only receive the
+        # input matrix, never the visualizer and its Chroma client.
+        pending = [(method, n_components) for method in methods for n_components in (3, 2)
+                   if (method, n_components) not in self._reduce_cache
+                   and self.combined_data['embeddings'].shape[1] != n_components]
+        if pending:
+            print(f"🔧 Fitting {len(pending)} reductions in parallel...")
+            with ProcessPoolExecutor(max_workers=len(methods)) as executor:
+                futures = {
+                    executor.submit(_fit_reducer, self._reducer_input(method), method, n_components): (method, n_components)
+                    for method, n_components in pending
+                }
+                for future in as_completed(futures):
+                    method, n_components = futures[future]
+                    try:
+                        self._reduce_cache[(method, n_components)] = future.result()
+                    except Exception as e:
+                        print(f"⚠️  {method.upper()} {n_components}D reduction failed: {e}")
+        
         for method in methods:
             try:
                 # 3D plot
@@ -306,7 +398,7 @@ class VectorVisualizer:
             'nhs_documents': sum(1 for source in self.combined_data['sources'] if source == 'NHS'),
             'cancer_documents': sum(1 for source in self.combined_data['sources'] if source == 'Cancer Research UK'),
             'embedding_dimensions': self.combined_data['embeddings'].shape[1],
-            'unique_titles': len(set(meta.get('title', 'Unknown') for meta in self.combined_data['metadatas'] if meta))
+            'unique_titles': int(self._df['title'].nunique())
         }
         
         # Create statistics visualization
@@ -366,7 +458,7 @@ class VectorVisualizer:
         
         # Save dashboard
         output_file = self.output_dir / "statistics_dashboard.html"
-        fig.write_html(str(output_file))
+        fig.write_html(str(output_file), include_plotlyjs='cdn', include_mathjax=False)
         print(f"💾 Saved statistics dashboard to: {output_file}")
         
         # Save statistics as JSON
@@ -381,28 +473,41 @@ class VectorVisualizer:
         """Perform and visualize cluster analysis."""
         print("🔍 Performing cluster analysis...")
         
-        from sklearn.cluster import KMeans
+        from sklearn.cluster import MiniBatchKMeans
         from sklearn.metrics import silhouette_score
         
         # Use PCA for clustering
         reduced_embeddings = self.reduce_dimensions('pca', n_components=10)
         
+        # Silhouette is quadratic in the number of points, so score a fixed-size sample
+        sample_size = min(2000, len(reduced_embeddings))
+        
         # Try different numbers of clusters
         n_clusters_range = range(2, min(11, len(reduced_embeddings)))
         silhouette_scores = []
+        labels_by_k = []
+        
+        if faiss is not None:
+            features = np.ascontiguousarray(reduced_embeddings, dtype=np.float32)
+            use_gpu = faiss.get_num_gpus() > 0
         
         for n_clusters in n_clusters_range:
-            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-            cluster_labels = kmeans.fit_predict(reduced_embeddings)
-            score = silhouette_score(reduced_embeddings, cluster_labels)
+            if faiss is not None:
+                kmeans = faiss.Kmeans(d=features.shape[1], k=n_clusters, niter=20, seed=42, gpu=use_gpu)
+                kmeans.train(features)
+                _, cluster_labels = kmeans.index.search(features, 1)
+                cluster_labels = cluster_labels.ravel()
+            else:
+                kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=1024, n_init=3)
+                cluster_labels = kmeans.fit_predict(reduced_embeddings)
+            score = silhouette_score(reduced_embeddings, cluster_labels, sample_size=sample_size, random_state=42)
             silhouette_scores.append(score)
+            labels_by_k.append(cluster_labels)
         
-        # Find optimal number of clusters
-        optimal_clusters = n_clusters_range[np.argmax(silhouette_scores)]
-        
-        # Perform clustering with optimal number
-        kmeans = KMeans(n_clusters=optimal_clusters, random_state=42)
-        cluster_labels = kmeans.fit_predict(reduced_embeddings)
+        # Reuse the labels from the best-scoring fit rather than clustering again
+        best = int(np.argmax(silhouette_scores))
+        optimal_clusters = n_clusters_range[best]
+        cluster_labels = labels_by_k[best]
         
         # Add cluster labels to data
         self.combined_data['cluster_labels'] = cluster_labels
@@ -414,7 +519,7 @@ class VectorVisualizer:
             'z': reduced_embeddings[:, 2],
             'cluster': cluster_labels,
             'source': self.combined_data['sources'],
-            'title': [meta.get('title', 'Unknown') if meta else 'Unknown' for meta in self.combined_data['metadatas']]
+            'title': self.combined_data['titles']
         })
         
         # Create 3D cluster plot
@@ -431,7 +536,7 @@ class VectorVisualizer:
         
         # Save cluster plot
         output_file = self.output_dir / "cluster_analysis.html"
-        fig.write_html(str(output_file))
+        fig.write_html(str(output_file), include_plotlyjs='cdn', include_mathjax=False)
         print(f"💾 Saved cluster analysis to: {output_file}")
         
         return fig, optimal_clusters
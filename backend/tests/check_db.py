@@ -13,10 +13,15 @@ def check_messages_table():
         print(f"Database file not found: {db_path}")
         return
     
-    conn = sqlite3.connect(db_path)
+    # Read-only so the check never contends with a running backend for write locks
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
     cursor = conn.cursor()
     
     try:
+        cursor.execute("PRAGMA query_only=ON;")
+        cursor.execute("PRAGMA temp_store=MEMORY;")
+        cursor.execute("PRAGMA cache_size=-64000;")
+        
         # Check table schema
         cursor.execute("PRAGMA table_info(messages);")
         columns = cursor.fetchall()
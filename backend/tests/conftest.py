@@ -0,0 +1,22 @@
+"""Shared test setup."""
+
+import os
+import pytest
+
+# Read before the placeholder below, so API tests only run with a real key
+_OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Settings require a key to import the app at all
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "requires_openai: calls the OpenAI API; skipped unless OPENAI_API_KEY is set")
+
+
+def pytest_collection_modifyitems(config, items):
+    if _OPENAI_API_KEY:
+        return
+    skip = pytest.mark.skip(reason="OPENAI_API_KEY is not set")
+    for item in items:
+        if "requires_openai" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,82 @@
+"""Tests for the admin analytics query."""
+
+import sys
+import os
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.v1.admin import analytics
+from app.db.models import Base, User, ChatSession, Message
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'analytics.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add(User(id=1, email="a@example.com", hashed_pw=b"x"))
+        session.add(ChatSession(id=1, user_id=1))
+        await session.flush()
+        # Each turn is one INSERT, so its question and answer share created_at
+        for question, category in [
+            ("What is flu?", "Symptoms & Diagnosis, Flu"),
+            ("Tell me a joke", "General"),
+            ("How is flu treated?", None),
+        ]:
+            await session.execute(insert(Message), [
+                {"session_id": 1, "role": "user", "content": question, "category": category},
+                {"session_id": 1, "role": "assistant", "content": f"Answer to {question}",
+                 "category": category, "user_question": question},
+            ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+async def _analytics(db, **filters):
+    return (await analytics(**{"user": None, "db": db, **filters}))["results"]
+
+
+@pytest.mark.asyncio
+async def test_turn_category_is_its_own(db):
+    """Each answer reports the category of its own question, not an earlier turn's."""
+    results = await _analytics(db)
+    assert {r["question"]: r["category"] for r in results} == {
+        "What is flu?": "Symptoms & Diagnosis, Flu",
+        "Tell me a joke": "General",
+        "How is flu treated?": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_category_filter(db):
+    """Filtering keeps the matching turns and those with an unknown category."""
+    results = await _analytics(db, category="General")
+    assert sorted(r["question"] for r in results) == ["How is flu treated?", "Tell me a joke"]
+
+
+@pytest.mark.asyncio
+async def test_after_id_pages(db):
+    """Passing back next_cursor walks every answer once, newest first."""
+    questions, filters = [], {}
+    while True:
+        page = await analytics(user=None, db=db, limit=1, **filters)
+        questions += [r["question"] for r in page["results"]]
+        if page["next_cursor"] is None:
+            break
+        filters = page["next_cursor"]
+    assert questions == ["How is flu treated?", "Tell me a joke", "What is flu?"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("answered", [True, False])
+async def test_unknown_after_id(db, answered):
+    """A cursor id that matches no row is rejected rather than giving an empty page."""
+    with pytest.raises(HTTPException) as exc_info:
+        await _analytics(db, answered=answered, after_id=999)
+    assert exc_info.value.status_code == 400
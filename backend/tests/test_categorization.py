@@ -1,49 +1,69 @@
-#!/usr/bin/env python3
-"""Test script for the categorization service."""
+"""Tests for the categorization service; most of these call the OpenAI API."""
 
 import sys
 import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-from app.services.categorization import categorize_question, get_available_categories, get_base_categories
-
-def test_categorization():
-    """Test the categorization function with various questions."""
-    
-    print("Testing categorization service...")
-    print(f"Available categories: {get_available_categories()}")
-    print(f"Base categories: {get_base_categories()}")
-    print()
-    
-    # Test questions
-    test_questions = [
-        "What are the symptoms of diabetes?",
-        "How is diabetes treated?",
-        "How can I prevent diabetes?",
-        "What medications are used for high blood pressure?",
-        "What causes migraines?",
-        "How can I lower my cholesterol naturally?",
-        "Tell me a joke",
-        "What's the weather like?",
-        "What are the symptoms of cancer?",
-        "How do I treat a headache?",
-        "What causes heart disease?",
-        "How can I prevent flu?",
-        "What are the side effects of aspirin?",
-        "How do I know if I have depression?",
-        "What's the best way to lose weight?"
-    ]
-    
-    for question in test_questions:
-        try:
-            category = categorize_question(question)
-            print(f"Q: {question}")
-            print(f"A: {category}")
-            print()
-        except Exception as e:
-            print(f"Q: {question}")
-            print(f"Error: {e}")
-            print()
-
-if __name__ == "__main__":
-    test_categorization() 
\ No newline at end of file
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_QUESTIONS = [
+    "What are the symptoms of diabetes?",
+    "How is diabetes treated?",
+    "How can I prevent diabetes?",
+    "What medications are used for high blood pressure?",
+    "What causes migraines?",
+    "How can I lower my cholesterol naturally?",
+    "Tell me a joke",
+    "What's the weather like?",
+    "What are the symptoms of cancer?",
+    "How do I treat a headache?",
+    "What causes heart disease?",
+    "How can I prevent flu?",
+    "What are the side effects of aspirin?",
+    "How do I know if I have depression?",
+    "What's the best way to lose weight?"
+]
+
+# One event loop for the whole run: the service's HTTP client is shared
+# and bound to the loop it was first used on
+session_loop = pytest.mark.asyncio(loop_scope="session")
+
+
+@pytest.fixture(scope="session")
+def categorization():
+    """Import the service once for every test in the session."""
+    from app.services import categorization
+    return categorization
+
+
+def test_categories(categorization):
+    """Accessors return the base categories."""
+    assert categorization.get_base_categories() == categorization.BASE_CATEGORIES
+    assert set(categorization.get_base_categories()) <= set(categorization.get_available_categories())
+
+
+@pytest.mark.requires_openai
+@session_loop
+@pytest.mark.parametrize("question", TEST_QUESTIONS)
+async def test_categorize_question(categorization, question):
+    """Each question gets a base category, optionally followed by a condition."""
+    category = await categorization.categorize_question(question)
+    assert category is not None
+    assert category.split(", ", 1)[0] in categorization.get_base_categories()
+
+
+@pytest.mark.requires_openai
+@session_loop
+async def test_categorize_questions(categorization, monkeypatch):
+    """The batched path returns one category per question, in order."""
+    # Start cold so the questions cached by test_categorize_question go through the batch call
+    categorization._category_cache.clear()
+    monkeypatch.setattr(categorization, "_get_disk_cache", lambda: None)
+    categories = await categorization.categorize_questions(TEST_QUESTIONS)
+    assert len(categories) == len(TEST_QUESTIONS)
+    assert all(category is not None for category in categories)
+
+
+@session_loop
+async def test_small_talk_is_general(categorization):
+    """Small talk is answered locally as General."""
+    assert await categorization.categorize_question("Tell me a joke") == "General"